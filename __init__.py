@@ -9,15 +9,21 @@ from .nodes import NODE_DISPLAY_NAME_MAPPINGS as VIDEO_NODE_DISPLAY_NAME_MAPPING
 from .image_nodes import NODE_CLASS_MAPPINGS as IMAGE_NODE_CLASS_MAPPINGS
 from .image_nodes import NODE_DISPLAY_NAME_MAPPINGS as IMAGE_NODE_DISPLAY_NAME_MAPPINGS
 
+# 导入批量分析节点
+from .batch_analytics import NODE_CLASS_MAPPINGS as ANALYTICS_NODE_CLASS_MAPPINGS
+from .batch_analytics import NODE_DISPLAY_NAME_MAPPINGS as ANALYTICS_NODE_DISPLAY_NAME_MAPPINGS
+
 # 合并所有节点映射
 NODE_CLASS_MAPPINGS = {}
 NODE_CLASS_MAPPINGS.update(VIDEO_NODE_CLASS_MAPPINGS)
 NODE_CLASS_MAPPINGS.update(IMAGE_NODE_CLASS_MAPPINGS)
+NODE_CLASS_MAPPINGS.update(ANALYTICS_NODE_CLASS_MAPPINGS)
 
 # 合并所有显示名称映射
 NODE_DISPLAY_NAME_MAPPINGS = {}
 NODE_DISPLAY_NAME_MAPPINGS.update(VIDEO_NODE_DISPLAY_NAME_MAPPINGS)
 NODE_DISPLAY_NAME_MAPPINGS.update(IMAGE_NODE_DISPLAY_NAME_MAPPINGS)
+NODE_DISPLAY_NAME_MAPPINGS.update(ANALYTICS_NODE_DISPLAY_NAME_MAPPINGS)
 
 # 导出
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS"]
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量提示词多样性与覆盖率分析
+Diversity and coverage analytics over generated prompt batches
+
+一批提示词用整数矩阵表示：每行是一条提示词，每列是一个分类，
+值为该分类中选项的下标（-1 表示"无"）。所有统计都用 NumPy 向量化计算，
+百万级批量可以在数秒内完成。
+键向量由 prompt_stream.py --keys-output 在批量生成时逐块写入 .npy 文件。
+"""
+
+import json
+import math
+import os
+
+import numpy as np
+
+try:
+    from .nodes import VIDEO_PRESETS, DEFAULT_LANGUAGE
+    from .image_nodes import IMAGE_PRESETS
+    from .preset_validation import build_param_mapping, preset_categories, preset_option_keys
+except ImportError:
+    # 如果是直接运行测试，使用绝对导入
+    from nodes import VIDEO_PRESETS, DEFAULT_LANGUAGE
+    from image_nodes import IMAGE_PRESETS
+    from preset_validation import build_param_mapping, preset_categories, preset_option_keys
+
+# 获取当前文件所在的目录路径
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYTICS_UI_LABELS_FILE_PATH = os.path.join(CURRENT_DIR, 'analytics_ui_labels.json')
+
+
+# 从 JSON 文件加载UI标签
+def load_analytics_ui_labels():
+    try:
+        with open(ANALYTICS_UI_LABELS_FILE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading analytics_ui_labels.json: {e}")
+        # 返回基本的英文标签作为回退
+        names = ["generator", "keys_file", "batch_size", "seed", "include_cooccurrence"]
+        return {
+            "zh": {name: name for name in names},
+            "en": {name: name for name in names},
+            "messages": {"zh": {}, "en": {}},
+            "display_names": {"zh": "提示词批量分析", "en": "Prompt Batch Analyzer"}
+        }
+
+
+ANALYTICS_UI_LABELS_DATA = load_analytics_ui_labels()
+ANALYTICS_PARAM_MAPPING = build_param_mapping(ANALYTICS_UI_LABELS_DATA,
+                                              ["generator", "keys_file", "batch_size", "seed", "include_cooccurrence"])
+
+# "无"在键向量中的取值
+NONE_INDEX = -1
+# 生成器名称 -> 预设数据，与 prompt_stream.GENERATORS 的名称一致
+GENERATOR_PRESETS = {
+    "video": VIDEO_PRESETS,
+    "image": IMAGE_PRESETS
+}
+
+
+def build_category_index(presets):
+    """
+    构建与语言无关的分类索引，与 shared_presets.compile_preset_table 使用同一套规范顺序
+    返回 (categories, options)：categories 为分类名列表（即键向量的列顺序），
+    options[category] 为该分类所有选项键名（不含 none/random），下标即键向量中的取值；
+    某种语言下显示文本为空的选项也占一个下标，只是不会被选中（预设校验会报告这类选项）
+    """
+    categories = preset_categories(presets)
+    options = {category: preset_option_keys(presets, category) for category in categories}
+    return categories, options
+
+
+def build_key_index(options):
+    """预先构建 {category: {key: 下标}}，编码时只做字典查找"""
+    return {category: {key: index for index, key in enumerate(keys)} for category, keys in options.items()}
+
+
+def encode_selection(category_params, categories, key_index):
+    """将 {category: key} 形式的选择结果编码为一条键向量"""
+    return [key_index[category].get(category_params.get(category, "none"), NONE_INDEX) for category in categories]
+
+
+class KeyVectorWriter:
+    """
+    把批量任务的选择结果写入 .npy 键向量文件，形状为 (rows, 分类数)
+    文件按总行数预先分配，第 index 条写到第 index - offset 行；续跑时重写相同的行即可，无需截断
+    任务完成前尚未写到的行为 -1（"无"）
+    """
+
+    def __init__(self, path, generator, rows, offset=0):
+        self.path = path
+        self.rows = rows
+        self.offset = offset
+        self.categories, options = build_category_index(GENERATOR_PRESETS[generator])
+        self.key_index = build_key_index(options)
+        self._array = None
+
+    def start(self, resume=False):
+        """新任务时创建文件；续跑时打开已有文件并检查形状"""
+        shape = (self.rows, len(self.categories))
+        if resume:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Keys file {self.path} is missing, cannot resume")
+            self._array = np.lib.format.open_memmap(self.path, mode="r+")
+            if self._array.shape != shape:
+                raise ValueError(f"Keys file {self.path} has shape {self._array.shape}, expected {shape}")
+        else:
+            self._array = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.int32, shape=shape)
+            self._array[:] = NONE_INDEX
+
+    def write(self, items):
+        """写入连续的一段 [(index, category_params), ...]"""
+        if not items:
+            return
+        start = items[0][0] - self.offset
+        self._array[start:start + len(items)] = [encode_selection(category_params, self.categories, self.key_index)
+                                                 for _, category_params in items]
+
+    def commit(self):
+        self._array.flush()
+
+    def close(self):
+        if self._array is not None:
+            self._array.flush()
+            self._array = None
+
+
+def _entropy_bits(counts):
+    """由计数计算香农熵（比特）"""
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    p = counts[counts > 0] / total
+    return max(0.0, float(-(p * np.log2(p)).sum()))
+
+
+def _unique_row_count(shifted, radices):
+    """统计不同组合的数量；混合进制编码不溢出时压缩为 int64，否则按行字节比较"""
+    space = 1
+    for radix in radices:
+        space *= int(radix)
+    if space < 2 ** 63:
+        codes = np.zeros(shifted.shape[0], dtype=np.int64)
+        for column, radix in enumerate(radices):
+            codes *= int(radix)
+            codes += shifted[:, column]
+        return int(np.unique(codes).size)
+    rows = np.ascontiguousarray(shifted).view(np.dtype((np.void, shifted.dtype.itemsize * shifted.shape[1])))
+    return int(np.unique(rows).size)
+
+
+def analyze_key_vectors(key_vectors, category_sizes, category_names=None, include_cooccurrence=False):
+    """
+    分析一批键向量
+    key_vectors: 形状为 (N, C) 的整数数组，取值范围 [-1, size)
+    category_sizes: 每个分类的可选项数量
+    category_names: 可选的分类名，默认使用列下标
+    include_cooccurrence: 是否在报告中包含每对分类的完整共现矩阵
+
+    返回可直接 JSON 序列化的报告：
+    - categories: 每个分类的直方图、"无"的次数、熵、均匀度（熵/最大熵）和已覆盖选项数
+    - duplicate_rate: 重复提示词的比例
+    - unique_combinations / combination_space / coverage: 组合空间覆盖率，
+      组合空间只统计出现过非"无"取值的分类，出现过"无"的分类把"无"也算作一个取值
+    - pairwise: 各分类两两之间的归一化互信息（0 表示独立，1 表示完全相关）
+    """
+    keys = np.asarray(key_vectors)
+    if keys.ndim != 2:
+        raise ValueError(f"key_vectors must be a 2D array, got shape {keys.shape}")
+    if not np.issubdtype(keys.dtype, np.integer):
+        raise ValueError(f"key_vectors must be an integer array, got dtype {keys.dtype}")
+    count, width = keys.shape
+    sizes = [int(size) for size in category_sizes]
+    if len(sizes) != width:
+        raise ValueError(f"Expected {len(sizes)} categories, got {width} columns")
+    names = list(category_names) if category_names is not None else [str(i) for i in range(width)]
+
+    # 平移一位，让"无"落在 0，选项下标从 1 开始，便于 bincount
+    shifted = keys.astype(np.int64) + 1
+    if count and (shifted.min() < 0 or (shifted.max(axis=0) > np.array(sizes)).any()):
+        raise ValueError("key_vectors contain indices outside of the category sizes")
+
+    report = {"count": int(count), "categories": {}}
+    entropies = []
+    radices = []
+    space = 1
+    for column, (name, size) in enumerate(zip(names, sizes)):
+        histogram = np.bincount(shifted[:, column], minlength=size + 1)
+        entropy = _entropy_bits(histogram)
+        entropies.append(entropy)
+        option_counts = histogram[1:]
+        max_entropy = math.log2(size) if size > 1 else 0.0
+        report["categories"][name] = {
+            "options": size,
+            "histogram": option_counts.tolist(),
+            "none": int(histogram[0]),
+            "entropy": round(entropy, 4),
+            "evenness": round(_entropy_bits(option_counts) / max_entropy, 4) if max_entropy else 0.0,
+            "covered": int((option_counts > 0).sum())
+        }
+        radices.append(size + 1)
+        if option_counts.any():
+            space *= size + (1 if histogram[0] else 0)
+
+    unique = _unique_row_count(shifted, radices) if count else 0
+    report["duplicate_rate"] = round(1 - unique / count, 6) if count else 0.0
+    report["unique_combinations"] = unique
+    report["combination_space"] = space
+    report["coverage"] = unique / space if space else 0.0
+
+    # 两两共现矩阵和归一化互信息
+    mutual_information = np.zeros((width, width))
+    cooccurrence = {}
+    for i in range(width):
+        for j in range(i + 1, width):
+            codes = shifted[:, i] * (sizes[j] + 1) + shifted[:, j]
+            matrix = np.bincount(codes, minlength=(sizes[i] + 1) * (sizes[j] + 1)).reshape(sizes[i] + 1, sizes[j] + 1)
+            if include_cooccurrence:
+                cooccurrence[f"{names[i]}|{names[j]}"] = matrix.tolist()
+            joint_entropy = _entropy_bits(matrix.ravel())
+            information = entropies[i] + entropies[j] - joint_entropy
+            denominator = min(entropies[i], entropies[j])
+            value = max(0.0, information / denominator) if denominator > 0 else 0.0
+            mutual_information[i, j] = mutual_information[j, i] = value
+    report["pairwise"] = {
+        "categories": names,
+        "normalized_mutual_information": np.round(mutual_information, 4).tolist()
+    }
+    if include_cooccurrence:
+        report["cooccurrence"] = cooccurrence
+    return report
+
+
+def sample_key_vectors(generator, batch_size, seed=0, language=DEFAULT_LANGUAGE, chunk_size=65536):
+    """
+    走生成器的随机选择路径（所有分类为"随机"，第 i 条使用 derive_seed(seed, i)）采样一批键向量
+    结果与 prompt_stream.py --seed seed --count batch_size --keys-output 写出的文件相同
+    抽取时直接从选项下标列表中选择（rng.choice 只取决于列表长度，结果与从键名列表中选择一致），
+    省去逐条的键名编码；结果按分块写入预先分配的 int32 数组，不构建逐行的 Python 列表
+    """
+    try:
+        from .prompt_stream import GENERATORS, sample_selections
+    except ImportError:
+        # 如果是直接运行测试，使用绝对导入
+        from prompt_stream import GENERATORS, sample_selections
+
+    _, table, generator_categories = GENERATORS[generator]
+    categories, options = build_category_index(GENERATOR_PRESETS[generator])
+    key_index = build_key_index(options)
+    index_options = {category: [key_index[category][key] for key in keys]
+                     for category, keys in table[language]["options"].items() if category in key_index}
+    # 没有可选项的分类会被解析为 "none"
+    columns = [(index_options.get(category) or {}, category) for category in categories]
+    key_vectors = np.empty((batch_size, len(categories)), dtype=np.int32)
+    for start in range(0, batch_size, chunk_size):
+        stop = min(start + chunk_size, batch_size)
+        selections = sample_selections(generator_categories, index_options, {}, seed, start, stop)
+        chunk = [[category_params[category] if choices else NONE_INDEX for choices, category in columns]
+                 for _, _, category_params in selections]
+        key_vectors[start:stop] = np.asarray(chunk, dtype=np.int32).reshape(stop - start, len(categories))
+    return key_vectors
+
+
+class PromptBatchAnalyzer:
+    """
+    提示词批量分析节点
+    Prompt Batch Analyzer Node
+
+    读取 prompt_stream.py --keys-output 保存的键向量（.npy），或者按生成器的随机选择路径采样一批，输出多样性与覆盖率报告
+    Loads key vectors (.npy) written by prompt_stream.py --keys-output, or samples a batch through the
+    generators' random selection path, and reports diversity and coverage
+    """
+
+    @classmethod
+    def INPUT_TYPES(s):
+        """定义输入类型"""
+        labels = ANALYTICS_UI_LABELS_DATA.get(DEFAULT_LANGUAGE, ANALYTICS_UI_LABELS_DATA["en"])
+        return {
+            "required": {
+                labels["generator"]: (["video", "image"], {"default": "video"}),
+                labels["keys_file"]: ("STRING", {"default": ""}),
+                labels["batch_size"]: ("INT", {"default": 10000, "min": 1, "max": 200000, "step": 1}),
+                labels["seed"]: ("INT", {"default": 0, "min": 0, "max": 2147483647, "step": 1}),
+                labels["include_cooccurrence"]: ("BOOLEAN", {"default": False})
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("report",)
+    FUNCTION = "analyze_batch"
+    CATEGORY = "self_node/Analysis"
+
+    def analyze_batch(self, **kwargs):
+        """分析批量提示词并返回 JSON 报告"""
+        # 将本地化参数名映射为英文参数名
+        params = {ANALYTICS_PARAM_MAPPING.get(key, key): value for key, value in kwargs.items()}
+        generator = params.get("generator", "video")
+        keys_file = params.get("keys_file", "")
+        batch_size = int(params.get("batch_size", 10000))
+        seed = int(params.get("seed", 0))
+        include_cooccurrence = bool(params.get("include_cooccurrence", False))
+
+        categories, options = build_category_index(GENERATOR_PRESETS[generator])
+
+        if keys_file.strip():
+            key_vectors = np.load(keys_file.strip(), mmap_mode="r")
+        else:
+            key_vectors = sample_key_vectors(generator, batch_size, seed)
+
+        report = analyze_key_vectors(key_vectors, [len(options[category]) for category in categories],
+                                     categories, include_cooccurrence)
+        messages = ANALYTICS_UI_LABELS_DATA.get("messages", {}).get(DEFAULT_LANGUAGE, {})
+        print(f"[PromptBatchAnalyzer] {report['count']} {messages.get('prompts', 'prompts')}, "
+              f"{messages.get('duplicate_rate', 'duplicate rate')} {report['duplicate_rate']:.4%}, "
+              f"{messages.get('coverage', 'coverage')} {report['coverage']:.4e}")
+        return (json.dumps(report, ensure_ascii=False),)
+
+
+# ComfyUI 节点注册
+NODE_CLASS_MAPPINGS = {
+    "Prompt_batch_analyzer": PromptBatchAnalyzer
+}
+
+# 节点显示名称的本地化映射
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "Prompt_batch_analyzer": ANALYTICS_UI_LABELS_DATA.get("display_names", {}).get(DEFAULT_LANGUAGE, "Prompt Batch Analyzer")
+}
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+共享预设表基准测试
+Benchmark: per-worker startup time and memory of the stream generator, JSON lookups vs. shared mmap table
+
+用法 / Usage:
+    python benchmarks/bench_shared_presets.py --workers 8 --scale 200 --prompts 1000
+
+--scale 会把每个分类的选项复制 N 倍，用来模拟更大的预设库。
+每个工作进程以 spawn 方式启动，先导入节点和 prompt_stream 模块（两种方式相同，不计入测量），
+再按流式批量生成的真实路径生成 --prompts 条提示词，只是查找表的来源不同：
+- json:   自己读取并解析 JSON，用 compile_verified_table 编译完整查找表（节点导入时的做法）
+- shared: 用 PresetTableView 挂载已发布的共享表，只计算可用选项的下标，键名和显示文本按需解码
+输出每个进程的启动耗时（查找表就绪）、生成耗时、RSS 增量和私有内存增量
+（Linux 下读取 /proc/self/smaps_rollup）。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from shared_presets import publish_preset_table, read_table_pointer  # noqa: E402
+
+LANGUAGE = "en"
+
+
+def read_memory_kb():
+    """返回 (rss, private) 内存，单位 kB；无法读取 smaps_rollup 时私有内存返回 None"""
+    try:
+        values = {}
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":"):
+                    values[parts[0][:-1]] = int(parts[1])
+        return values.get("Rss", 0), values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上 ru_maxrss 的单位是字节
+        return (rss // 1024 if sys.platform == "darwin" else rss), None
+
+
+def scale_presets(presets, scale):
+    """把每个分类的选项复制 scale 倍"""
+    scaled = {}
+    for language, categories in presets.items():
+        scaled[language] = {}
+        for category, items in categories.items():
+            new_items = {}
+            for key, value in items.items():
+                if key in ["none", "random"]:
+                    new_items[key] = value
+                    continue
+                for copy_index in range(scale):
+                    suffix = "" if copy_index == 0 else f"_{copy_index}"
+                    new_items[f"{key}{suffix}"] = f"{value}{suffix}" if value else value
+            scaled[language][category] = new_items
+    return scaled
+
+
+def load_json_lookups(json_path):
+    """独立加载：解析 JSON 并编译节点使用的完整查找表"""
+    from nodes import UI_LABELS_DATA, VIDEO_CATEGORIES
+    from preset_validation import compile_verified_table
+
+    with open(json_path, "r", encoding="utf-8") as f:
+        presets = json.load(f)
+    table = compile_verified_table(presets, UI_LABELS_DATA, VIDEO_CATEGORIES)
+    return table, table[LANGUAGE]["options"], table[LANGUAGE]["texts"]
+
+
+def load_shared_lookups(table_path):
+    """共享挂载：只计算可用选项的下标，键名和显示文本在生成时按需解码"""
+    from nodes import VIDEO_CATEGORIES
+    from shared_presets import PresetTableView
+
+    view = PresetTableView(table_path, LANGUAGE, VIDEO_CATEGORIES)
+    return view, view.options, view.texts
+
+
+LOADERS = {"json": load_json_lookups, "shared": load_shared_lookups}
+
+
+def worker(mode, path, prompts, queue):
+    """加载查找表并生成 prompts 条提示词，报告启动耗时、生成耗时和内存增量"""
+    from nodes import VIDEO_CATEGORIES, WanVideoPromptGenerator
+    from prompt_stream import format_prompts, sample_selections
+
+    node = WanVideoPromptGenerator()
+    rss_before, private_before = read_memory_kb()
+    start = time.perf_counter()
+    holder, options, texts = LOADERS[mode](path)
+    loaded = time.perf_counter()
+    items = sample_selections(VIDEO_CATEGORIES, options, {}, 42, 0, prompts)
+    for _ in format_prompts(items, node, "", "professional", 0, LANGUAGE, texts):
+        pass
+    generated = time.perf_counter()
+    rss_after, private_after = read_memory_kb()
+    queue.put((loaded - start, generated - loaded, rss_after - rss_before,
+               None if private_before is None else private_after - private_before))
+    # 保持引用直到测量结束
+    del holder, options, texts
+
+
+def run_workers(mode, path, prompts, workers):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, path, prompts, queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results
+
+
+def summarize(name, results):
+    startup = [r[0] * 1000 for r in results]
+    generate = [r[1] * 1000 for r in results]
+    rss = [r[2] for r in results]
+    private = [r[3] for r in results if r[3] is not None]
+    private_text = f"{statistics.mean(private):10.0f}" if private else f"{'n/a':>10}"
+    print(f"{name:<8} {statistics.mean(startup):12.2f} {max(startup):10.2f} {statistics.mean(generate):12.2f} "
+          f"{statistics.mean(rss):10.0f} {private_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared preset table benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="number of worker processes")
+    parser.add_argument("--scale", type=int, default=100, help="replicate every option N times")
+    parser.add_argument("--prompts", type=int, default=1000, help="prompts generated by each worker")
+    parser.add_argument("--presets", default=os.path.join(ROOT_DIR, "Prompt_Presets.json"), help="preset JSON file")
+    args = parser.parse_args()
+
+    with open(args.presets, "r", encoding="utf-8") as f:
+        presets = scale_presets(json.load(f), args.scale)
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "presets.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(presets, f, ensure_ascii=False)
+        table_path = os.path.join(directory, "presets.table")
+        publish_start = time.perf_counter()
+        version = publish_preset_table(presets, table_path)
+        publish_ms = (time.perf_counter() - publish_start) * 1000
+
+        path_for = {"json": json_path, "shared": table_path}
+        print(f"presets: {os.path.getsize(json_path) / 1024:.0f} KiB JSON, "
+              f"{os.path.getsize(read_table_pointer(table_path)[1]) / 1024:.0f} KiB table "
+              f"(version {version:016x}, published in {publish_ms:.1f} ms)")
+        print(f"{args.workers} workers, {args.prompts} prompts each, averages per worker")
+        print(f"{'mode':<8} {'startup ms':>12} {'max ms':>10} {'generate ms':>12} {'RSS kB':>10} {'private kB':>10}")
+        for mode in LOADERS:
+            summarize(mode, run_workers(mode, path_for[mode], args.prompts, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,18 @@ import json
 import os
 import locale
 import random
-import time
+
+try:
+    from .prompt_tokens import precompute_token_counts, fit_elements_to_budget
+    from .prompt_profiler import register_profiled
+    from .preset_validation import validate_presets, compile_verified_table, build_param_mapping, report_issues
+    from .seed_stream import derive_seed, next_auto_seed
+except ImportError:
+    # 如果是直接运行测试，使用绝对导入
+    from prompt_tokens import precompute_token_counts, fit_elements_to_budget
+    from prompt_profiler import register_profiled
+    from preset_validation import validate_presets, compile_verified_table, build_param_mapping, report_issues
+    from seed_stream import derive_seed, next_auto_seed
 
 # 获取当前文件所在的目录路径
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -70,6 +81,35 @@ VIDEO_PRESETS = load_video_presets()
 UI_LABELS_DATA = load_ui_labels()
 UI_LABELS = UI_LABELS_DATA  # 保持向后兼容
 
+# 视频分类（顺序即 Token 预算装箱时的优先级）
+VIDEO_CATEGORIES = ["shot_size", "lighting_type", "light_source", "color_tone", "camera_angle", "lens",
+    "camera_movement_basic", "camera_movement_advanced", "time_of_day", "motion",
+    "visual_effects", "stylization_visual_style", "character_emotion", "composition"]
+
+# 加载时校验预设并编译查找表，生成时不再重复做防御性检查
+VIDEO_PRESET_ISSUES = validate_presets(VIDEO_PRESETS, UI_LABELS_DATA, VIDEO_CATEGORIES)
+VIDEO_TABLE = compile_verified_table(VIDEO_PRESETS, UI_LABELS_DATA, VIDEO_CATEGORIES, {
+    "unsupported_language": "Unsupported language",
+    "fallback_to_default": ", fallback to default language",
+    "generated_prompt": "Generated prompt with",
+    "cinematic_elements": "cinematic elements",
+    "selected_elements": "Selected elements",
+    "token_budget_exceeded": "User prompt and suffix alone exceed the token budget, the text encoder will truncate the prompt"
+})
+VIDEO_PARAM_MAPPING = build_param_mapping(UI_LABELS_DATA, ["language", "user_prompt"] + VIDEO_CATEGORIES + ["prompt_format", "max_tokens", "seed", "batch_index"])
+report_issues("VideoPromptGenerator", VIDEO_PRESET_ISSUES)
+
+# 详细格式的分组：(分类列表, 中文标题, 英文标题)，同时用于 Token 预算预留
+DETAILED_GROUPS = [
+    (["shot_size", "camera_angle", "composition"], "镜头构图：", "Shot composition: "),
+    (["lighting_type", "light_source", "color_tone", "time_of_day"], "灯光：", "Lighting: "),
+    (["lens", "camera_movement_basic", "camera_movement_advanced", "motion"], "摄像机工作：", "Camera work: "),
+    (["visual_effects", "stylization_visual_style", "character_emotion"], "视觉风格：", "Visual style: ")
+]
+
+# 预计算所有预设文本和标签的 Token 数，组装时无需重新分词
+precompute_token_counts(VIDEO_PRESETS, UI_LABELS_DATA, DETAILED_GROUPS)
+
 class WanVideoPromptGenerator:
     """
     视频提示词生成器节点（双语版本）
@@ -141,158 +181,132 @@ class WanVideoPromptGenerator:
                     labels["format_simple"], 
                     labels["format_detailed"]
                 ], {"default": labels["format_professional"]})
+            },
+            # 新增的输入放在 optional 中，ComfyUI 按位置恢复已保存工作流的控件值，不会错位
+            "optional": {
+                labels["max_tokens"]: ("INT", {"default": 0, "min": 0, "max": 4096, "step": 1}),
+                labels["seed"]: ("INT", {"default": -1, "min": -1, "max": 2147483647, "step": 1}),
+                labels["batch_index"]: ("INT", {"default": 0, "min": 0, "max": 2147483647, "step": 1})
             }
         }
     
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("generated_prompt",)
+    RETURN_TYPES = ("STRING", "INT")
+    RETURN_NAMES = ("generated_prompt", "seed")
     FUNCTION = "generate_video_prompt"
     CATEGORY = "self_node/Video"
     
     def generate_video_prompt(self, **kwargs):
-        # 处理随机种子
-        seed = kwargs.get("seed", -1)
-        if seed == -1:
-            # 使用当前时间+随机数作为种子，确保每次都不同
-            import hashlib
-            timestamp = str(time.time())
-            # 使用时间戳和一个额外的随机因子来生成更好的种子
-            seed_str = timestamp + str(random.randint(0, 999999))
-            seed = int(hashlib.md5(seed_str.encode()).hexdigest()[:8], 16) % 2147483647
-        random.seed(seed)
-        print(f"[视频提示词生成器] 使用随机种子: {seed}")
         """生成视频提示词"""
         
-        # 创建参数映射以支持本地化的参数名称
-        # 将本地化的参数名映射回英文键名
-        param_mapping = {}
-        for lang_code in ["zh", "en"]:
-            labels = UI_LABELS[lang_code]
-            for en_key, localized_name in labels.items():
-                if en_key in ["language", "user_prompt", "shot_size", "lighting_type", "light_source", 
-                             "color_tone", "camera_angle", "lens", "camera_movement_basic", 
-                             "camera_movement_advanced", "time_of_day", "motion", "visual_effects",
-                             "stylization_visual_style", "character_emotion", "composition", "prompt_format", "seed"]:
-                    param_mapping[localized_name] = en_key
-        
-        # 创建选项值的反向映射（本地化文本 -> 键名）
-        def create_value_to_key_mapping(language):
-            value_to_key = {}
-            if language in VIDEO_PRESETS:
-                for category, items in VIDEO_PRESETS[language].items():
-                    for key, value in items.items():
-                        if value:  # 只映射非空值
-                            value_to_key[value] = key
-                # 处理"无"选项
-                none_text = UI_LABELS_DATA[language].get("none_option", "none")
-                value_to_key[none_text] = "none"
-                
-                # 处理"随机"选项
-                random_text = UI_LABELS_DATA[language].get("random_option", "random")
-                value_to_key[random_text] = "random"
-                
-                # 处理prompt_format选项的映射
-                labels = UI_LABELS[language]
-                value_to_key[labels["format_professional"]] = "professional"
-                value_to_key[labels["format_simple"]] = "simple"
-                value_to_key[labels["format_detailed"]] = "detailed"
-            return value_to_key
-        
         # 将本地化参数名和值映射为英文参数名和键名
-        params = {}
-        for key, value in kwargs.items():
-            mapped_key = param_mapping.get(key, key)
-            params[mapped_key] = value
+        params = self.map_params(kwargs)
         
-        # 提取参数
-        language = params.get("language", DEFAULT_LANGUAGE)
+        # 处理随机种子：-1 时先从自动种子流中取一个种子，本条的随机数再由 (种子, 批次序号) 派生
+        # 输出和显示的是填回种子输入即可复现本条的种子；使用独立的随机数生成器，不影响全局 random 的状态
+        seed = int(params.get("seed", -1))
+        if seed == -1:
+            seed = next_auto_seed()
+        batch_index = int(params.get("batch_index", 0) or 0)
+        rng = random.Random(derive_seed(seed, batch_index))
+        if batch_index:
+            print(f"[视频提示词生成器] 使用随机种子: {seed}，批次序号: {batch_index}")
+        else:
+            print(f"[视频提示词生成器] 使用随机种子: {seed}")
         
-        # 创建当前语言的值到键的映射
-        value_to_key = create_value_to_key_mapping(language)
+        # 提取参数并验证语言
+        language = params.get("language", DEFAULT_LANGUAGE)
+        if language not in VIDEO_TABLE:
+            messages = VIDEO_TABLE[DEFAULT_LANGUAGE]["messages"]
+            print(f"[VideoPromptGenerator] {messages['unsupported_language']}: {language}{messages['fallback_to_default']}: {DEFAULT_LANGUAGE}")
+            language = DEFAULT_LANGUAGE
+        current_table = VIDEO_TABLE[language]
         
         # 提取并转换参数值
-        user_prompt = params.get("user_prompt", UI_LABELS[language]["default_prompt"])
+        user_prompt = params.get("user_prompt", current_table["labels"]["default_prompt"])
         
-        # 验证语言参数并获取预设数据
-        if language not in VIDEO_PRESETS:
-            messages = UI_LABELS_DATA.get("messages", {}).get(DEFAULT_LANGUAGE, {})
-            unsupported_msg = messages.get("unsupported_language", "Unsupported language")
-            fallback_msg = messages.get("fallback_to_default", ", fallback to default language")
-            print(f"[VideoPromptGenerator] {unsupported_msg}: {language}{fallback_msg}: {DEFAULT_LANGUAGE}")
-            language = DEFAULT_LANGUAGE
+        # 将本地化文本转换回键名，并处理随机选择
+        category_params = self.resolve_categories(params, language, rng)
         
-        # 获取当前语言的预设数据
-        current_presets = VIDEO_PRESETS[language]
-        current_labels = UI_LABELS[language]
+        # prompt_format不需要随机功能，单独处理
+        prompt_format = current_table["format_to_key"].get(params.get("prompt_format"), "professional")
+        
+        # Token 预算，0 表示不限制
+        max_tokens = int(params.get("max_tokens", 0) or 0)
         
-        # 对于选项类型的参数，需要将本地化文本转换回键名，并处理随机选择
-        def convert_value_to_key(value, category, default="none"):
+        # 根据格式生成提示词
+        generated_prompt, selected_elements, reserved_tokens = self.format_prompt(user_prompt, category_params, prompt_format, max_tokens, language)
+        
+        # 本地化的输出信息
+        self.log_result(language, selected_elements, reserved_tokens, max_tokens)
+        
+        return (generated_prompt, seed)
+    
+    def map_params(self, kwargs):
+        """将本地化的参数名映射回英文键名"""
+        return {VIDEO_PARAM_MAPPING.get(key, key): value for key, value in kwargs.items()}
+    
+    def resolve_categories(self, params, language, rng):
+        """将各分类的本地化选项转换为键名，"随机"在此处抽取，返回 {category: key}"""
+        current_table = VIDEO_TABLE[language]
+        value_to_key = current_table["value_to_key"]
+        options = current_table["options"]
+        texts = current_table["texts"]
+        
+        category_params = {}
+        for category in VIDEO_CATEGORIES:
+            value = params.get(category)
             if not value:
-                return default
+                category_params[category] = "none"
+                continue
             
             # 获取键名
-            key = value_to_key.get(value, value)
+            key = value_to_key[category].get(value, value)
             
-            # 如果选择了随机，从该分类中随机选择一个非none、非random的选项
-            if key == "random" and category in current_presets:
-                available_options = [k for k in current_presets[category].keys() 
-                                   if k not in ["none", "random"] and current_presets[category][k]]
-                if available_options:
-                    key = random.choice(available_options)
-                    print(f"[随机选择] {category}: {current_presets[category][key]}")
+            # 如果选择了随机，从该分类的可用选项中随机选择一个
+            if key == "random":
+                if options[category]:
+                    key = rng.choice(options[category])
+                    print(f"[随机选择] {category}: {texts[category][key]}")
                 else:
                     key = "none"
-            
-            return key
-        
-        shot_size = convert_value_to_key(params.get("shot_size"), "shot_size")
-        lighting_type = convert_value_to_key(params.get("lighting_type"), "lighting_type")
-        light_source = convert_value_to_key(params.get("light_source"), "light_source")
-        color_tone = convert_value_to_key(params.get("color_tone"), "color_tone")
-        camera_angle = convert_value_to_key(params.get("camera_angle"), "camera_angle")
-        lens = convert_value_to_key(params.get("lens"), "lens")
-        camera_movement_basic = convert_value_to_key(params.get("camera_movement_basic"), "camera_movement_basic")
-        camera_movement_advanced = convert_value_to_key(params.get("camera_movement_advanced"), "camera_movement_advanced")
-        time_of_day = convert_value_to_key(params.get("time_of_day"), "time_of_day")
-        motion = convert_value_to_key(params.get("motion"), "motion")
-        visual_effects = convert_value_to_key(params.get("visual_effects"), "visual_effects")
-        stylization_visual_style = convert_value_to_key(params.get("stylization_visual_style"), "stylization_visual_style")
-        character_emotion = convert_value_to_key(params.get("character_emotion"), "character_emotion")
-        composition = convert_value_to_key(params.get("composition"), "composition")
-        
-        # prompt_format不需要随机功能，单独处理
-        prompt_format_value = params.get("prompt_format")
-        prompt_format = value_to_key.get(prompt_format_value, "professional") if prompt_format_value else "professional"
-        
-
-        
-        # 收集所有选择的元素
-        selected_elements = []
-        
-        # 定义参数映射
-        category_params = {
-            "shot_size": shot_size,
-            "lighting_type": lighting_type,
-            "light_source": light_source,
-            "color_tone": color_tone,
-            "camera_angle": camera_angle,
-            "lens": lens,
-            "camera_movement_basic": camera_movement_basic,
-            "camera_movement_advanced": camera_movement_advanced,
-            "time_of_day": time_of_day,
-            "motion": motion,
-            "visual_effects": visual_effects,
-            "stylization_visual_style": stylization_visual_style,
-            "character_emotion": character_emotion,
-            "composition": composition
-        }
+            category_params[category] = key
+        return category_params
+    
+    def format_prompt(self, user_prompt, category_params, prompt_format, max_tokens, language, texts=None):
+        """
+        根据格式生成提示词，返回 (generated_prompt, selected_elements, reserved_tokens)
+        reserved_tokens: 用户提示词、后缀等必须保留的文本的 Token 数，未设置 Token 预算时为 0
+        texts: 可选的 {category: {key: 显示文本}} 查找，默认使用已校验的查找表（批量任务可传入共享预设表的视图）
+        """
+        if texts is None:
+            texts = VIDEO_TABLE[language]["texts"]
+        current_labels = VIDEO_TABLE[language]["labels"]
         
-        # 提取选中的非空元素
+        # 提取选中的元素（按分类顺序，即优先级顺序）；查找表中只有可用选项，"none" 查不到
+        selected_items = []
         for category, value in category_params.items():
-            if value != "none" and category in current_presets and value in current_presets[category]:
-                element_text = current_presets[category][value]
-                if element_text:  # 确保元素文本不为空
-                    selected_elements.append(element_text)
+            element_text = texts[category].get(value)
+            if element_text is not None:
+                selected_items.append((category, element_text))
+        
+        # 按 Token 预算装箱，预留用户提示词、后缀和标题的长度；没有元素时也计算预留长度，用于超出预算的警告
+        reserved_tokens = 0
+        if max_tokens > 0:
+            separator = "，" if language == "zh" else ", "
+            if prompt_format == "professional":
+                reserved_texts = [user_prompt, current_labels["professional_suffix"]]
+            else:
+                reserved_texts = [user_prompt]
+            group_headers = None
+            if prompt_format == "detailed":
+                # 详细格式：后缀固定预留（按实际输出的形式，即连接符加去掉开头标点的后缀），分组标题在该组装入第一个元素时才计入
+                connector = "。" if language == "zh" else ". "
+                reserved_texts.append(connector + current_labels["detailed_suffix"].lstrip(". 。"))
+                group_headers = {category: (zh_header if language == "zh" else en_header)
+                                 for categories, zh_header, en_header in DETAILED_GROUPS for category in categories}
+            selected_items, reserved_tokens = fit_elements_to_budget(selected_items, max_tokens, reserved_texts, separator,
+                                                                     group_headers)
+        selected_elements = [element_text for _, element_text in selected_items]
         
         # 根据格式生成提示词
         if prompt_format == "professional":
@@ -312,23 +326,17 @@ class WanVideoPromptGenerator:
                 style_elements = []
                 
                 # 分类整理元素
-                shot_categories = ["shot_size", "camera_angle", "composition"]
-                lighting_categories = ["lighting_type", "light_source", "color_tone", "time_of_day"]
-                camera_categories = ["lens", "camera_movement_basic", "camera_movement_advanced", "motion"]
-                style_categories = ["visual_effects", "stylization_visual_style", "character_emotion"]
+                shot_categories, lighting_categories, camera_categories, style_categories = [group[0] for group in DETAILED_GROUPS]
                 
-                for category, value in category_params.items():
-                    if value != "none" and category in current_presets and value in current_presets[category]:
-                        element_text = current_presets[category][value]
-                        if element_text:
-                            if category in shot_categories:
-                                shot_elements.append(element_text)
-                            elif category in lighting_categories:
-                                lighting_elements.append(element_text)
-                            elif category in camera_categories:
-                                camera_elements.append(element_text)
-                            elif category in style_categories:
-                                style_elements.append(element_text)
+                for category, element_text in selected_items:
+                    if category in shot_categories:
+                        shot_elements.append(element_text)
+                    elif category in lighting_categories:
+                        lighting_elements.append(element_text)
+                    elif category in camera_categories:
+                        camera_elements.append(element_text)
+                    elif category in style_categories:
+                        style_elements.append(element_text)
                 
                 # 构建详细提示词
                 prompt_parts = [user_prompt]
@@ -353,37 +361,45 @@ class WanVideoPromptGenerator:
                     if style_elements:
                         prompt_parts.append(f"Visual style: {separator.join(style_elements)}")
                 
-                prompt_parts.append(current_labels['detailed_suffix'].lstrip(". "))
+                prompt_parts.append(current_labels['detailed_suffix'].lstrip(". 。"))
                 connector = "。" if language == "zh" else ". "
                 generated_prompt = connector.join(prompt_parts)
             else:
                 connector = "。" if language == "zh" else ". "
-                generated_prompt = f"{user_prompt}{connector}{current_labels['detailed_suffix'].lstrip('. ')}"
+                generated_prompt = f"{user_prompt}{connector}{current_labels['detailed_suffix'].lstrip('. 。')}"
                 
         else:  # simple format
             if selected_elements:
                 # 选择最重要的几个元素
-                key_elements = selected_elements[:3]  # 只取前3个元素
+                # 设置了 Token 预算时已按预算装箱，否则只取前3个元素
+                key_elements = selected_elements if max_tokens > 0 else selected_elements[:3]
                 separator = "，" if language == "zh" else ", "
                 generated_prompt = f"{user_prompt}{separator}{separator.join(key_elements)}"
             else:
                 generated_prompt = user_prompt
         
-        # 本地化的输出信息
-        messages = UI_LABELS_DATA.get("messages", {}).get(language, {})
-        generated_msg = messages.get("generated_prompt", "Generated prompt with")
-        elements_msg = messages.get("cinematic_elements", "cinematic elements")
-        selected_msg = messages.get("selected_elements", "Selected elements")
+        return generated_prompt, selected_elements, reserved_tokens
+    
+    def log_result(self, language, selected_elements, reserved_tokens=0, max_tokens=0):
+        """输出本地化的生成信息；超出 Token 预算时给出警告"""
+        messages = VIDEO_TABLE[language]["messages"]
         
         if language == "zh":
-            print(f"视频提示词生成器 ({language}): {generated_msg} {len(selected_elements)} {elements_msg}")
+            print(f"视频提示词生成器 ({language}): {messages['generated_prompt']} {len(selected_elements)} {messages['cinematic_elements']}")
         else:
-            print(f"VideoPromptGenerator ({language}): {generated_msg} {len(selected_elements)} {elements_msg}")
+            print(f"VideoPromptGenerator ({language}): {messages['generated_prompt']} {len(selected_elements)} {messages['cinematic_elements']}")
         
         if selected_elements:
-            print(f"{selected_msg}: {selected_elements}")
+            print(f"{messages['selected_elements']}: {selected_elements}")
         
-        return (generated_prompt,)
+        # 元素已按预算装箱，只有用户提示词和后缀本身就放不下时才会超出
+        if max_tokens > 0 and reserved_tokens > max_tokens:
+            print(f"[VideoPromptGenerator] {messages['token_budget_exceeded']}: {reserved_tokens} > {max_tokens}")
+
+# 注册性能分析的各个阶段（仅在开启性能分析时才会安装计时包装）
+register_profiled(WanVideoPromptGenerator, "generate_video_prompt",
+                  ["map_params", "resolve_categories", "format_prompt", "log_result"],
+                  "video_prompt_generator")
 
 # ComfyUI 节点注册
 NODE_CLASS_MAPPINGS = {
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预设数据校验与编译
+Preset validation and diagnostics, compiled once at load
+
+加载时对预设和 UI 标签做一次完整校验，报告数据问题，并编译出已校验的查找表。
+生成节点每次调用只需在表中做少量字典查找，不再重复做防御性检查。
+
+报告的问题：
+- error   missing_category / missing_key / missing_label：某种语言缺少分类、选项或标签
+- warning duplicate_text：同一分类中多个选项的显示文本相同，下拉框中无法区分
+- warning empty_text：可选项的显示文本为空，不会出现在下拉框中，也不会被随机选中
+- warning reserved_text：选项文本与"无"/"随机"/格式名称相同，会被它们覆盖
+- info    random_sentinel：以 "random": "random" 形式存放在预设中的随机占位值
+
+命令行检查 / CLI:
+    python preset_validation.py              # 检查内置的视频和图片预设
+    python preset_validation.py --strict     # 有 warning 时也返回非零退出码
+"""
+
+import argparse
+import sys
+
+SEVERITIES = ["error", "warning", "info"]
+SENTINEL_KEYS = ["none", "random"]
+FORMAT_KEYS = ["professional", "simple", "detailed"]
+# 生成节点在每种语言下都需要的标签（分类标签另外检查）
+REQUIRED_LABELS = ["language", "user_prompt", "prompt_format", "max_tokens", "seed", "batch_index", "default_prompt",
+                   "professional_suffix", "detailed_suffix", "format_professional", "format_simple",
+                   "format_detailed", "none_option", "random_option"]
+
+
+def preset_categories(presets):
+    """所有语言的分类名并集，按 JSON 中出现的顺序（先出现的语言优先）"""
+    # dict 保留插入顺序，去重是 O(1) 的，大型预设库也不会退化为平方复杂度
+    categories = {}
+    for language_presets in presets.values():
+        categories.update(dict.fromkeys(language_presets))
+    return list(categories)
+
+
+def preset_option_keys(presets, category):
+    """
+    分类下所有语言的选项键名并集（不含 none/random），按 JSON 中出现的顺序
+    这是与语言无关的规范顺序：查找表的可选项、共享预设表和批量分析的键向量下标都以它为准
+    """
+    keys = {}
+    for language_presets in presets.values():
+        keys.update(dict.fromkeys(language_presets.get(category, {})))
+    return [key for key in keys if key not in SENTINEL_KEYS]
+
+
+def _issue(severity, code, message, language=None, category=None, key=None):
+    return {"severity": severity, "code": code, "language": language, "category": category,
+            "key": key, "message": message}
+
+
+def validate_presets(presets, labels_data, categories):
+    """校验预设和标签，返回问题列表"""
+    issues = []
+    languages = [language for language in presets if language in labels_data]
+    for language in presets:
+        if language not in labels_data:
+            issues.append(_issue("error", "missing_label", f"no UI labels for language '{language}'", language))
+
+    for language in languages:
+        labels = labels_data[language]
+        for name in REQUIRED_LABELS + list(categories):
+            if name not in labels:
+                issues.append(_issue("error", "missing_label", f"label '{name}' is missing", language, key=name))
+
+    for category in categories:
+        for language in languages:
+            if category not in presets[language]:
+                issues.append(_issue("error", "missing_category", f"category '{category}' is missing",
+                                     language, category))
+        # 所有语言的键名并集，用于检查某种语言缺少的选项
+        all_keys = preset_option_keys({language: presets[language] for language in languages}, category)
+
+        for language in languages:
+            items = presets[language].get(category)
+            if items is None:
+                continue
+            labels = labels_data[language]
+            reserved = {labels.get("none_option", "none"), labels.get("random_option", "random")}
+            reserved.update(labels.get(f"format_{name}", name) for name in FORMAT_KEYS)
+
+            for key in all_keys:
+                if key not in items:
+                    issues.append(_issue("error", "missing_key", f"option '{key}' is missing",
+                                         language, category, key))
+
+            if items.get("random") == "random":
+                issues.append(_issue("info", "random_sentinel", "'random' sentinel is stored as a preset value",
+                                     language, category, "random"))
+
+            keys_by_text = {}
+            for key, text in items.items():
+                if key in SENTINEL_KEYS:
+                    continue
+                if not text:
+                    issues.append(_issue("warning", "empty_text", f"option '{key}' has no display text",
+                                         language, category, key))
+                    continue
+                if text in reserved:
+                    issues.append(_issue("warning", "reserved_text",
+                                         f"option '{key}' uses the reserved text '{text}'", language, category, key))
+                keys_by_text.setdefault(text, []).append(key)
+            for text, keys in keys_by_text.items():
+                if len(keys) > 1:
+                    issues.append(_issue("warning", "duplicate_text",
+                                         f"options {keys} share the display text '{text}'",
+                                         language, category, keys[-1]))
+    return issues
+
+
+def compile_verified_table(presets, labels_data, categories, message_defaults=None):
+    """
+    编译已校验的查找表：{language: {...}}
+    - value_to_key[category]: 本地化文本 -> 键名（按分类区分，不同分类的相同文本不会互相覆盖），包含"无"和"随机"
+    - options[category]: 可随机选择的键名列表（非占位、非空文本），按 preset_option_keys 的规范顺序
+    - texts[category]: 键名 -> 显示文本，只包含可用选项，"none" 不在其中
+    - format_to_key: 格式名称 -> 格式键名
+    - labels / messages: 当前语言的标签和补全了默认值的输出信息
+    缺失的分类和标签按空值/默认值处理，具体问题由 validate_presets 报告
+    """
+    table = {}
+    for language in presets:
+        if language not in labels_data:
+            continue
+        labels = labels_data[language]
+        none_text = labels.get("none_option", "none")
+        random_text = labels.get("random_option", "random")
+
+        value_to_key = {}
+        options = {}
+        texts = {}
+        for category in categories:
+            items = presets[language].get(category, {})
+            usable = {key: items[key] for key in preset_option_keys(presets, category) if items.get(key)}
+            category_map = {text: key for key, text in usable.items()}
+            category_map[none_text] = "none"
+            category_map[random_text] = "random"
+            value_to_key[category] = category_map
+            options[category] = list(usable.keys())
+            texts[category] = usable
+
+        messages = dict(message_defaults or {})
+        messages.update(labels_data.get("messages", {}).get(language, {}))
+        table[language] = {
+            "value_to_key": value_to_key,
+            "options": options,
+            "texts": texts,
+            "format_to_key": {labels.get(f"format_{name}", name): name for name in FORMAT_KEYS},
+            "labels": labels,
+            "messages": messages
+        }
+    return table
+
+
+def build_param_mapping(labels_data, param_names):
+    """构建所有语言的本地化参数名 -> 英文键名 映射"""
+    param_mapping = {}
+    for language, labels in labels_data.items():
+        if language in ["messages", "display_names"]:
+            continue
+        for name in param_names:
+            if name in labels:
+                param_mapping[labels[name]] = name
+    return param_mapping
+
+
+def summarize_issues(issues):
+    """按严重程度统计问题数量"""
+    counts = {severity: 0 for severity in SEVERITIES}
+    for issue in issues:
+        counts[issue["severity"]] += 1
+    return counts
+
+
+def report_issues(name, issues):
+    """加载时输出一行摘要（只在有 error/warning 时输出）"""
+    counts = summarize_issues(issues)
+    if counts["error"] or counts["warning"]:
+        print(f"[{name}] Preset validation: {counts['error']} errors, {counts['warning']} warnings "
+              f"(run 'python preset_validation.py' for details)", file=sys.stderr)
+
+
+def format_issue(issue):
+    location = "/".join(part for part in [issue["language"], issue["category"], issue["key"]] if part)
+    return f"{issue['severity']:<8}{issue['code']:<18}{location}: {issue['message']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate prompt presets and UI labels")
+    parser.add_argument("--strict", action="store_true", help="exit with a non-zero status on warnings too")
+    parser.add_argument("--quiet", action="store_true", help="hide info-level diagnostics")
+    args = parser.parse_args()
+
+    import nodes
+    import image_nodes
+
+    exit_code = 0
+    for name, issues in [("Prompt_Presets.json / ui_labels.json", nodes.VIDEO_PRESET_ISSUES),
+                         ("Image_Presets.json / image_ui_labels.json", image_nodes.IMAGE_PRESET_ISSUES)]:
+        counts = summarize_issues(issues)
+        print(f"{name}: {counts['error']} errors, {counts['warning']} warnings, {counts['info']} info")
+        for issue in issues:
+            if args.quiet and issue["severity"] == "info":
+                continue
+            print(f"  {format_issue(issue)}")
+        if counts["error"] or (args.strict and counts["warning"]):
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成器节点的可选性能分析
+Opt-in profiling hooks for the prompt generator nodes
+
+开启后为生成方法的各个阶段（参数映射、随机抽取、格式化、控制台输出）
+包装计时器，并可每隔 N 次调用用 cProfile 采样一次，结果写入本地目录：
+- phase_timings.json：各阶段的累计耗时
+- <node>_<call>.prof：cProfile 采样结果，可用 snakeviz / pstats 查看
+
+未开启时不会安装任何包装，节点方法保持原样，没有额外开销。
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+
+# 环境变量开关
+PROFILE_ENV_VAR = "PROMPT_HELPER_PROFILE"                # 设为 1/true/on 开启
+PROFILE_DIR_ENV_VAR = "PROMPT_HELPER_PROFILE_DIR"        # 输出目录，默认为插件目录下的 profiles/
+PROFILE_EVERY_ENV_VAR = "PROMPT_HELPER_PROFILE_EVERY"    # 每隔 N 次调用做一次 cProfile 采样，0 表示不采样
+PROFILE_FLUSH_ENV_VAR = "PROMPT_HELPER_PROFILE_FLUSH"    # 每隔 N 次调用写一次阶段耗时，默认 50
+
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+PHASE_TIMINGS_FILE = "phase_timings.json"
+
+# 已注册的节点方法：name -> (cls, method_name, phase_names)
+_registry = {}
+# 已安装的包装：(cls, attr) -> 原始函数
+_originals = {}
+# 阶段耗时统计：name -> {phase: [calls, total_seconds, max_seconds]}
+_stats = {}
+_calls = {}
+_lock = threading.Lock()
+
+_settings = {"enabled": False, "directory": DEFAULT_PROFILE_DIR, "sample_every": 0, "flush_every": 50}
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").strip().lower() in ["1", "true", "yes", "on"]
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _record(name, phase, elapsed):
+    """累计一个阶段的耗时"""
+    with _lock:
+        entry = _stats.setdefault(name, {}).setdefault(phase, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        if elapsed > entry[2]:
+            entry[2] = elapsed
+
+
+def _phase_wrapper(name, phase, func):
+    """为单个阶段方法包装计时器"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record(name, phase, time.perf_counter() - start)
+    return wrapper
+
+
+def _entry_wrapper(name, func):
+    """为节点入口方法包装总耗时统计和 cProfile 采样"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            call_index = _calls.get(name, 0) + 1
+            _calls[name] = call_index
+        sample_every = _settings["sample_every"]
+        profiler = cProfile.Profile() if sample_every > 0 and call_index % sample_every == 0 else None
+
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _record(name, "total", time.perf_counter() - start)
+            if profiler is not None:
+                os.makedirs(_settings["directory"], exist_ok=True)
+                profiler.dump_stats(os.path.join(_settings["directory"], f"{name}_{call_index:06d}.prof"))
+            flush_every = _settings["flush_every"]
+            if flush_every > 0 and call_index % flush_every == 0:
+                write_phase_timings()
+    return wrapper
+
+
+def _install(name):
+    cls, method_name, phase_names = _registry[name]
+    for attr in list(phase_names) + [method_name]:
+        if (cls, attr) in _originals:
+            continue
+        original = getattr(cls, attr)
+        _originals[(cls, attr)] = original
+        if attr == method_name:
+            setattr(cls, attr, _entry_wrapper(name, original))
+        else:
+            setattr(cls, attr, _phase_wrapper(name, attr, original))
+
+
+def register_profiled(cls, method_name, phase_names, name):
+    """
+    注册节点的入口方法及其阶段方法
+    只有在开启性能分析时才会真正安装包装；通过环境变量开启时在注册时立即安装
+    """
+    _registry[name] = (cls, method_name, tuple(phase_names))
+    if _settings["enabled"]:
+        _install(name)
+
+
+def enable_profiling(directory=None, sample_every=None, flush_every=None):
+    """开启性能分析，并为所有已注册的节点安装包装"""
+    if directory is not None:
+        _settings["directory"] = directory
+    if sample_every is not None:
+        _settings["sample_every"] = int(sample_every)
+    if flush_every is not None:
+        _settings["flush_every"] = int(flush_every)
+    _settings["enabled"] = True
+    for name in _registry:
+        _install(name)
+    print(f"[PromptProfiler] Profiling enabled, writing to {_settings['directory']}")
+
+
+def disable_profiling():
+    """关闭性能分析，写出已收集的耗时并还原原始方法"""
+    if not _settings["enabled"]:
+        return
+    write_phase_timings()
+    for (cls, attr), original in _originals.items():
+        setattr(cls, attr, original)
+    _originals.clear()
+    _settings["enabled"] = False
+
+
+def get_phase_timings():
+    """返回汇总后的阶段耗时（毫秒）"""
+    with _lock:
+        summary = {}
+        for name, phases in _stats.items():
+            summary[name] = {}
+            for phase, (calls, total, maximum) in phases.items():
+                summary[name][phase] = {
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 4),
+                    "mean_ms": round(total * 1000 / calls, 4) if calls else 0.0,
+                    "max_ms": round(maximum * 1000, 4)
+                }
+        return summary
+
+
+def write_phase_timings():
+    """将阶段耗时写入输出目录"""
+    summary = get_phase_timings()
+    if not summary:
+        return None
+    try:
+        os.makedirs(_settings["directory"], exist_ok=True)
+        path = os.path.join(_settings["directory"], PHASE_TIMINGS_FILE)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return path
+    except Exception as e:
+        print(f"[PromptProfiler] Error writing phase timings: {e}")
+        return None
+
+
+def _flush_at_exit():
+    if _settings["enabled"]:
+        write_phase_timings()
+
+
+# 从环境变量读取开关
+if _env_flag(PROFILE_ENV_VAR):
+    _settings["enabled"] = True
+    _settings["directory"] = os.environ.get(PROFILE_DIR_ENV_VAR) or DEFAULT_PROFILE_DIR
+    _settings["sample_every"] = _env_int(PROFILE_EVERY_ENV_VAR, 0)
+    _settings["flush_every"] = _env_int(PROFILE_FLUSH_ENV_VAR, 50)
+    print(f"[PromptProfiler] Profiling enabled, writing to {_settings['directory']}")
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大批量提示词的流式分块输出
+Streaming chunked output for very large prompt batch jobs
+
+流水线由生成器串联：抽取(sample) → 解析(resolve) → 格式化(format) → 输出(sink)。
+每次只在内存中保留一个分块，输出端写完一个分块后才会继续生成下一个（拉取式背压），
+因此峰值内存与总数量无关。每个分块写完后记录检查点，崩溃后可以从检查点继续。
+第 index 条的随机选择只取决于 (seed, index)（见 seed_stream），与生成顺序无关，
+因此可以用 --shard/--shards 把同一任务切分给多个进程并行生成，结果与单进程一致。
+--keys-output 会同时把每条的选择结果写成 .npy 键向量，供批量分析节点读取。
+--preset-table 让工作进程从 mmap 共享预设表（见 shared_presets）中按需读取选项和显示文本，
+每写完一个分块检查一次表的版本，预设重新发布后后续分块即使用新版本。
+
+用法 / Usage:
+    python prompt_stream.py --generator video --count 1000000 --output prompts.txt \\
+        --chunk-size 10000 --checkpoint prompts.ckpt.json --resume
+    python prompt_stream.py --generator video --count 1000000 --seed 42 --shard 0 --shards 4 \\
+        --output prompts.0.jsonl --output-format jsonl
+    python shared_presets.py Prompt_Presets.json /tmp/video_presets.table
+    python prompt_stream.py --generator video --count 1000000 --seed 42 --shard 0 --shards 4 \\
+        --preset-table /tmp/video_presets.table --output prompts.0.txt
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+try:
+    from .nodes import WanVideoPromptGenerator, VIDEO_TABLE, VIDEO_CATEGORIES, DEFAULT_LANGUAGE
+    from .image_nodes import WanImagePromptGenerator, IMAGE_TABLE, IMAGE_CATEGORIES
+    from .seed_stream import MAX_SEED, derive_seed, shard_range
+    from .batch_analytics import KeyVectorWriter
+    from .shared_presets import PresetTableView
+except ImportError:
+    # 如果是直接运行测试，使用绝对导入
+    from nodes import WanVideoPromptGenerator, VIDEO_TABLE, VIDEO_CATEGORIES, DEFAULT_LANGUAGE
+    from image_nodes import WanImagePromptGenerator, IMAGE_TABLE, IMAGE_CATEGORIES
+    from seed_stream import MAX_SEED, derive_seed, shard_range
+    from batch_analytics import KeyVectorWriter
+    from shared_presets import PresetTableView
+
+# 生成器名称 -> (节点类, 已校验的查找表, 分类列表)
+GENERATORS = {
+    "video": (WanVideoPromptGenerator, VIDEO_TABLE, VIDEO_CATEGORIES),
+    "image": (WanImagePromptGenerator, IMAGE_TABLE, IMAGE_CATEGORIES)
+}
+
+
+# ---------------------------------------------------------------------------
+# 流水线各阶段
+# ---------------------------------------------------------------------------
+
+def sample_selections(categories, options, selections, seed, start, stop):
+    """
+    抽取阶段：为 [start, stop) 中的每条提示词解析各分类的键名，"random" 在此处抽取
+    第 index 条使用由 (seed, index) 派生的随机数，与节点中 随机种子=seed、批次序号=index 的结果一致
+    逐条 yield (index, seed, {category: key})，seed 即在节点中复现该条时填入的随机种子
+    """
+    for index in range(start, stop):
+        rng = random.Random(derive_seed(seed, index))
+        category_params = {}
+        for category in categories:
+            key = selections.get(category, "random")
+            if key == "random":
+                key = rng.choice(options[category]) if options[category] else "none"
+            category_params[category] = key
+        yield index, seed, category_params
+
+
+def format_prompts(items, node, user_prompt, prompt_format, max_tokens, language, texts=None):
+    """
+    格式化阶段：复用节点的格式化逻辑，不输出控制台信息；保留选择结果供键向量输出使用
+    texts: 可选的显示文本查找，默认使用节点的查找表
+    """
+    for index, seed, category_params in items:
+        generated_prompt, _, _ = node.format_prompt(user_prompt, category_params, prompt_format, max_tokens, language,
+                                                    texts)
+        yield index, generated_prompt, seed, category_params
+
+
+def chunked(items, chunk_size):
+    """分块：每次只拉取 chunk_size 条，不会预取下一块"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# 输出端
+# ---------------------------------------------------------------------------
+
+def _format_lines(chunk, output_format):
+    if output_format == "jsonl":
+        return "".join(json.dumps({"index": index, "seed": seed, "prompt": prompt}, ensure_ascii=False) + "\n"
+                       for index, prompt, seed, _ in chunk)
+    return "".join(prompt.replace("\n", " ") + "\n" for _, prompt, _, _ in chunk)
+
+
+class FileSink:
+    """
+    写入文件，每行一条提示词（text）或一个 JSON 对象（jsonl）
+    commit() 时落盘并返回当前偏移；从检查点恢复时先截断到该偏移，丢弃崩溃前未记录的部分
+    """
+
+    def __init__(self, path, output_format="text"):
+        self.path = path
+        self.output_format = output_format
+        self._file = None
+
+    def start(self, state):
+        """开始写入；state 为检查点中记录的状态，新任务时为空"""
+        offset = state.get("offset", 0)
+        # 文件缺失或比检查点短时，truncate 会用空字节补齐，输出中间出现一段空洞，必须拒绝续跑
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < offset:
+            raise ValueError(f"Output {self.path} has {size} bytes but the checkpoint expects {offset}, cannot resume")
+        self._file = open(self.path, "ab")
+        self._file.truncate(offset)
+
+    def write(self, chunk):
+        self._file.write(_format_lines(chunk, self.output_format).encode("utf-8"))
+
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"offset": self._file.tell()}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class StdoutSink:
+    """写入标准输出"""
+
+    def __init__(self, output_format="text"):
+        self.output_format = output_format
+
+    def start(self, state):
+        pass
+
+    def write(self, chunk):
+        sys.stdout.write(_format_lines(chunk, self.output_format))
+
+    def commit(self):
+        sys.stdout.flush()
+        return {}
+
+    def close(self):
+        pass
+
+
+class CallbackSink:
+    """
+    把每个分块 [(index, prompt, seed, {category: key}), ...] 交给回调函数
+    回调阻塞期间不会生成下一块，慢速消费者自然形成背压
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def start(self, state):
+        pass
+
+    def write(self, chunk):
+        self.callback(chunk)
+
+    def commit(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# 检查点
+# ---------------------------------------------------------------------------
+
+def load_checkpoint(path):
+    """读取检查点，不存在时返回 None"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """原子地写入检查点"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".ckpt-", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
+
+# ---------------------------------------------------------------------------
+# 主流程
+# ---------------------------------------------------------------------------
+
+def make_stream_config(generator="video", count=1, seed=-1, language=DEFAULT_LANGUAGE, user_prompt=None,
+                       selections=None, prompt_format="professional", max_tokens=0, shard=0, shards=1):
+    """
+    校验并规范化批量任务配置
+    selections: {category: key | "random" | "none"}，未指定的分类默认为 "random"
+    seed 为 -1 时在此处确定实际种子，并随检查点保存；分片并行时各进程必须指定相同的种子
+    shard/shards: 只生成 [0, count) 均匀切分后的第 shard 份
+    """
+    if generator not in GENERATORS:
+        raise ValueError(f"Unknown generator: {generator}")
+    _, table, _ = GENERATORS[generator]
+    if language not in table:
+        language = DEFAULT_LANGUAGE
+    options = table[language]["options"]
+    selections = dict(selections or {})
+    for category, key in selections.items():
+        if category not in options:
+            raise ValueError(f"Unknown category for {generator}: {category}")
+        if key not in ["none", "random"] and key not in options[category]:
+            raise ValueError(f"Unknown option for {category}: {key}")
+    if prompt_format not in ["professional", "simple", "detailed"]:
+        raise ValueError(f"Unknown prompt format: {prompt_format}")
+    shard_range(int(count), int(shard), int(shards))
+    if seed == -1:
+        seed = random.randrange(MAX_SEED)
+    return {
+        "generator": generator,
+        "count": int(count),
+        "seed": int(seed),
+        "language": language,
+        "user_prompt": table[language]["labels"]["default_prompt"] if user_prompt is None else user_prompt,
+        "selections": selections,
+        "prompt_format": prompt_format,
+        "max_tokens": int(max_tokens),
+        "shard": int(shard),
+        "shards": int(shards)
+    }
+
+
+def build_pipeline(config, start=None, preset_view=None):
+    """
+    按配置串联抽取与格式化阶段，返回逐条 yield (index, prompt, seed, {category: key}) 的生成器
+    start: 从哪个下标开始，默认为当前分片的起点
+    preset_view: 可选的 PresetTableView，选项和显示文本从共享预设表读取，而不是节点的查找表
+    """
+    node_class, table, categories = GENERATORS[config["generator"]]
+    if preset_view is None:
+        options, texts = table[config["language"]]["options"], None
+    else:
+        options, texts = preset_view.options, preset_view.texts
+    shard_start, shard_stop = shard_range(config["count"], config["shard"], config["shards"])
+    if start is None:
+        start = shard_start
+    items = sample_selections(categories, options, config["selections"], config["seed"], start, shard_stop)
+    return format_prompts(items, node_class(), config["user_prompt"], config["prompt_format"],
+                          config["max_tokens"], config["language"], texts)
+
+
+def run_prompt_stream(sink, chunk_size=1000, checkpoint_path=None, resume=False, progress=None, keys_output=None,
+                      preset_table=None, **config):
+    """
+    运行批量任务并把结果分块写入 sink，返回本次写入的条数
+    checkpoint_path: 每写完一个分块就记录检查点（下一条的下标、输出端状态）
+    resume: 存在检查点时从检查点继续；检查点中的配置必须与本次一致（seed 为 -1 时沿用检查点中的种子）
+    progress: 可选回调 progress(done, total)，按当前分片计数
+    keys_output: 可选的 .npy 路径，同时写出当前分片每条的键向量（见 batch_analytics.KeyVectorWriter）
+    preset_table: 可选的共享预设表指针文件（见 shared_presets.publish_preset_table）；
+        每写完一个分块检查一次版本，重新发布后从下一个分块起使用新版本
+    """
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is not None and config.get("seed", -1) == -1:
+        config["seed"] = checkpoint["config"]["seed"]
+    config = make_stream_config(**config)
+
+    shard_start, shard_stop = shard_range(config["count"], config["shard"], config["shards"])
+    start = shard_start
+    sink_state = {}
+    if checkpoint is not None:
+        if checkpoint["config"] != config:
+            raise ValueError(f"Checkpoint {checkpoint_path} was written for a different configuration")
+        if checkpoint.get("keys_output") != keys_output:
+            raise ValueError(f"Checkpoint {checkpoint_path} was written with keys output {checkpoint.get('keys_output')}")
+        start = checkpoint["next_index"]
+        sink_state = checkpoint.get("sink", {})
+
+    preset_view = None
+    if preset_table:
+        _, _, categories = GENERATORS[config["generator"]]
+        preset_view = PresetTableView(preset_table, config["language"], categories)
+
+    keys = None
+    if keys_output:
+        keys = KeyVectorWriter(keys_output, config["generator"], shard_stop - shard_start, shard_start)
+        keys.start(resume=checkpoint is not None)
+
+    written = 0
+    sink.start(sink_state)
+    try:
+        for chunk in chunked(build_pipeline(config, start, preset_view), chunk_size):
+            sink.write(chunk)
+            sink_state = sink.commit()
+            if keys is not None:
+                keys.write([(index, category_params) for index, _, _, category_params in chunk])
+                keys.commit()
+            written += len(chunk)
+            # 每条的种子只取决于下标，记录下一条的下标即可恢复
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, {
+                    "config": config,
+                    "next_index": chunk[-1][0] + 1,
+                    "sink": sink_state,
+                    "keys_output": keys_output
+                })
+            if progress is not None:
+                progress(start - shard_start + written, shard_stop - shard_start)
+            # 分块之间检查共享预设表是否重新发布；流水线持有的查找会被原地更新
+            if preset_view is not None and preset_view.refresh():
+                print(f"[PromptStream] Preset table reloaded (version {preset_view.version:016x})", file=sys.stderr)
+    finally:
+        sink.close()
+        if preset_view is not None:
+            preset_view.close()
+        if keys is not None:
+            keys.close()
+    return written
+
+
+def _parse_selections(values):
+    selections = {}
+    for value in values or []:
+        category, _, key = value.partition("=")
+        selections[category.strip()] = key.strip()
+    return selections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream large prompt batches in chunks")
+    parser.add_argument("--generator", choices=list(GENERATORS.keys()), default="video")
+    parser.add_argument("--count", type=int, required=True, help="total number of prompts")
+    parser.add_argument("--seed", type=int, default=-1, help="-1 picks a seed and records it in the checkpoint")
+    parser.add_argument("--language", choices=["zh", "en"], default=DEFAULT_LANGUAGE)
+    parser.add_argument("--user-prompt", default=None)
+    parser.add_argument("--select", action="append", metavar="CATEGORY=KEY",
+                        help="fix a category to a key, 'random' or 'none' (default: random)")
+    parser.add_argument("--format", dest="prompt_format", choices=["professional", "simple", "detailed"],
+                        default="professional")
+    parser.add_argument("--max-tokens", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--output", default="-", help="output file, '-' for stdout")
+    parser.add_argument("--output-format", choices=["text", "jsonl"], default="text")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file, written after every chunk")
+    parser.add_argument("--resume", action="store_true", help="resume from the checkpoint if it exists")
+    parser.add_argument("--shard", type=int, default=0, help="index of the slice of [0, count) to generate")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of slices; run one process per shard with the same --seed")
+    parser.add_argument("--preset-table", default=None,
+                        help="read options and texts from a shared preset table published by shared_presets.py")
+    parser.add_argument("--keys-output", default=None,
+                        help="also write each prompt's selections as .npy key vectors for the batch analyzer")
+    args = parser.parse_args()
+
+    if args.output == "-":
+        sink = StdoutSink(args.output_format)
+    else:
+        sink = FileSink(args.output, args.output_format)
+
+    def report(done, total):
+        print(f"[PromptStream] {done}/{total}", file=sys.stderr)
+
+    run_prompt_stream(sink, chunk_size=args.chunk_size, checkpoint_path=args.checkpoint, resume=args.resume,
+                      progress=report if args.output != "-" else None, keys_output=args.keys_output,
+                      preset_table=args.preset_table,
+                      generator=args.generator, count=args.count, seed=args.seed, language=args.language,
+                      user_prompt=args.user_prompt, selections=_parse_selections(args.select),
+                      prompt_format=args.prompt_format, max_tokens=args.max_tokens,
+                      shard=args.shard, shards=args.shards)
+
+
+if __name__ == "__main__":
+    main()
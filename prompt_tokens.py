@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+提示词 Token 预算工具
+Token budget helpers for prompt assembly
+
+下游文本编码器（CLIP 77 / T5 512 等）会静默截断过长的提示词，
+这里在加载时预先计算每个预设文本的 Token 数，组装时按优先级装箱，
+避免每次生成都重新分词。
+"""
+
+import os
+import re
+
+# 可选：指向本地 tokenizer.json 的环境变量（需要安装 tokenizers 库）
+TOKENIZER_ENV_VAR = "PROMPT_HELPER_TOKENIZER"
+
+# 中日韩字符及全角标点，按字符计数
+_CJK_PATTERN = re.compile(r"[　-〿぀-ヿ㐀-䶿一-鿿豈-﫿＀-￯]")
+# 其他文本按单词/数字/标点切分
+_WORD_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+# 当前使用的分词器（None 表示使用字符启发式估算）
+_tokenizer = None
+# 预设文本 -> Token 数 的缓存，加载时填充
+_token_cache = {}
+
+
+def _heuristic_count(text):
+    """字符启发式估算：中文每字约1个Token，英文每个单词约1个Token（长单词按6字符拆分）"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    rest = _CJK_PATTERN.sub(" ", text)
+    word_count = 0
+    for word in _WORD_PATTERN.findall(rest):
+        word_count += max(1, (len(word) + 5) // 6)
+    return cjk_count + word_count
+
+
+def _compute_count(text):
+    """使用已注册的分词器计数，未注册时使用启发式估算"""
+    if _tokenizer is None:
+        return _heuristic_count(text)
+    if hasattr(_tokenizer, "encode"):
+        encoded = _tokenizer.encode(text)
+        # tokenizers 库返回 Encoding 对象，transformers/tiktoken 返回列表
+        return len(getattr(encoded, "ids", encoded))
+    return int(_tokenizer(text))
+
+
+def count_tokens(text):
+    """返回文本的 Token 数，优先命中预计算缓存"""
+    if not text:
+        return 0
+    cached = _token_cache.get(text)
+    if cached is not None:
+        return cached
+    return _compute_count(text)
+
+
+def precompute_token_counts(*tables):
+    """
+    预计算预设/标签表中所有字符串的 Token 数
+    接受任意嵌套的 dict/list，例如 {"zh": {"shot_size": {"wide_shot": "全景"}}}
+    """
+    def walk(node):
+        if isinstance(node, dict):
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, (list, tuple)):
+            for value in node:
+                walk(value)
+        elif isinstance(node, str) and node and node not in _token_cache:
+            _token_cache[node] = _compute_count(node)
+
+    for table in tables:
+        walk(table)
+    return _token_cache
+
+
+def set_tokenizer(tokenizer):
+    """
+    注册本地分词器并重新计算缓存
+    tokenizer 可以是 callable(text) -> int，或者带有 encode(text) 方法的对象；传入 None 恢复启发式估算
+    """
+    global _tokenizer
+    _tokenizer = tokenizer
+    texts = list(_token_cache.keys())
+    _token_cache.clear()
+    for text in texts:
+        _token_cache[text] = _compute_count(text)
+
+
+def load_tokenizer_from_env():
+    """如果设置了环境变量，则从本地 tokenizer.json 加载分词器"""
+    tokenizer_path = os.environ.get(TOKENIZER_ENV_VAR)
+    if not tokenizer_path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_file(tokenizer_path)
+        # 不计入 BOS/EOS 等特殊 Token，由 max_tokens 的取值预留
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    except Exception as e:
+        print(f"Error loading tokenizer from {tokenizer_path}: {e}")
+        return None
+
+
+def fit_elements_to_budget(items, max_tokens, reserved_texts=(), separator=", ", group_headers=None):
+    """
+    按优先级将元素装入 Token 预算
+    items: [(category, text), ...]，顺序即优先级
+    reserved_texts: 必须保留的文本（用户提示词、后缀等），先从预算中扣除
+    group_headers: 可选的 {category: 标题}，某个标题只在其分组装入第一个元素时计入
+    返回 (kept, reserved_tokens)：kept 为能装入预算的元素，保持原有顺序，放不下的元素跳过，继续尝试后面更短的元素；
+    reserved_tokens 为必须保留的文本的 Token 数，大于 max_tokens 时说明它们本身就放不下（未限制预算时为 0）
+    """
+    if max_tokens <= 0:
+        return list(items), 0
+
+    reserved_tokens = sum(count_tokens(text) for text in reserved_texts)
+    remaining = max_tokens - reserved_tokens
+    separator_cost = count_tokens(separator.strip()) or 1
+
+    kept = []
+    used_headers = set()
+    for category, text in items:
+        cost = count_tokens(text) + separator_cost
+        header = group_headers.get(category) if group_headers else None
+        if header and header not in used_headers:
+            cost += count_tokens(header)
+        if cost <= remaining:
+            kept.append((category, text))
+            remaining -= cost
+            if header:
+                used_headers.add(header)
+    return kept, reserved_tokens
+
+
+# 启动时尝试加载环境变量指定的分词器
+_env_tokenizer = load_tokenizer_from_env()
+if _env_tokenizer is not None:
+    set_tokenizer(_env_tokenizer)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基于计数器的种子派生
+Counter-based seed streams for reproducible, parallelizable random selections
+
+第 index 条提示词的种子由 (基础种子, 下标) 经 SplitMix64 混合直接得到，
+不需要按顺序跑完前面的条目：任意一条都可以 O(1) 单独重新生成，
+并行的工作进程按下标区间切分即可，无需协调。
+未指定种子时，从进程启动时取一次的系统熵派生，每次调用只做一次整数混合，
+不再调用 time.time() 和 MD5。
+"""
+
+import itertools
+import os
+
+# 与节点种子输入的范围一致：[0, 2147483646]
+MAX_SEED = 2147483647
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+
+def splitmix64(value):
+    """SplitMix64 的输出混合函数"""
+    z = value & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def derive_seed(base_seed, index, stream=0):
+    """
+    由基础种子和下标派生第 index 条的种子
+    stream 用于区分同一基础种子下互不相关的多条种子流
+    """
+    key = splitmix64(base_seed + stream * _GOLDEN_GAMMA)
+    return splitmix64(key + (index + 1) * _GOLDEN_GAMMA) % MAX_SEED
+
+
+def shard_range(count, shard, shards):
+    """把 [0, count) 均匀切分为 shards 份，返回第 shard 份的 (start, stop)"""
+    if shards <= 0 or not 0 <= shard < shards:
+        raise ValueError(f"Invalid shard {shard} of {shards}")
+    return count * shard // shards, count * (shard + 1) // shards
+
+
+# 未指定种子时使用的自动种子流：进程启动时取一次系统熵，之后按调用次数派生
+_auto_base = int.from_bytes(os.urandom(8), "little")
+_auto_counter = itertools.count()
+
+
+def next_auto_seed():
+    """为未指定种子的调用派生一个新种子"""
+    return derive_seed(_auto_base, next(_auto_counter))
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多进程共享的预设表
+Shared preset tables for multi-process generation workers
+
+把预设编译为一个紧凑的二进制表（字符串池 + 每个分类的下标数组），发布到文件后，
+各个工作进程通过 mmap 零拷贝挂载，不再各自解析 JSON、构建字典。
+分类和选项的顺序取自 preset_validation.preset_option_keys 的规范顺序（与语言无关），
+因此选项下标与 batch_analytics.build_category_index 的键向量一致。
+
+表头带有内容哈希作为版本号。每个版本写入各自的文件（<名称>.<版本号>.bin），
+发布时只原子地替换一个很小的指针文件（JSON，记录当前版本和文件名），
+被工作进程映射中的表文件本身从不被替换，因此在 Windows 下也能重新发布。
+工作进程通过 is_stale()/refresh() 读取指针文件，发现新版本后重新挂载。
+旧版本的文件在发布时清理，只保留最近的几个；仍被映射的文件（Windows）删除失败时跳过，下次发布再试。
+
+二进制布局（小端，所有数组按 8 字节对齐）：
+    header: magic, layout_version, version, 语言数, 分类数, 选项数, 字符串数, 字符串池字节数
+    language_ids[语言数]            语言名的字符串 id
+    category_ids[分类数]            分类名的字符串 id
+    category_offsets[分类数 + 1]    每个分类的选项在 key_ids 中的区间
+    key_ids[选项数]                 选项键名的字符串 id
+    text_ids[语言数 * 选项数]       每种语言下选项显示文本的字符串 id
+    string_offsets[字符串数 + 1]    字符串在字符串池中的区间
+    string_pool                     UTF-8 编码的字符串池
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+try:
+    from .preset_validation import preset_categories, preset_option_keys
+except ImportError:
+    # 如果是直接运行测试，使用绝对导入
+    from preset_validation import preset_categories, preset_option_keys
+
+TABLE_MAGIC = b"PHPT"
+LAYOUT_VERSION = 1
+# magic, layout_version, version, n_languages, n_categories, n_keys, n_strings, pool_size
+_HEADER = struct.Struct("<4sIQIIIIQ")
+_INDEX_DTYPE = np.dtype("<u4")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _section_layout(n_languages, n_categories, n_keys, n_strings):
+    """按各部分的长度计算 (名称, 偏移, 元素个数)，读写双方共用"""
+    sections = []
+    offset = _align(_HEADER.size)
+    for name, count in [("language_ids", n_languages),
+                        ("category_ids", n_categories),
+                        ("category_offsets", n_categories + 1),
+                        ("key_ids", n_keys),
+                        ("text_ids", n_languages * n_keys),
+                        ("string_offsets", n_strings + 1)]:
+        sections.append((name, offset, count))
+        offset = _align(offset + count * _INDEX_DTYPE.itemsize)
+    return sections, offset
+
+
+def compile_preset_table(presets):
+    """
+    将 {language: {category: {key: text}}} 形式的预设编译为二进制表
+    分类和选项按规范顺序（所有语言的并集），none/random 不进入选项数组；
+    某种语言缺少的选项或空文本编译为空字符串
+    返回 (payload, version)
+    """
+    languages = list(presets.keys())
+    categories = preset_categories(presets)
+
+    strings = []
+    string_ids = {}
+
+    def intern(text):
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(strings)
+            strings.append(text)
+        return string_id
+
+    language_ids = [intern(language) for language in languages]
+    category_ids = [intern(category) for category in categories]
+    category_offsets = [0]
+    flat_keys = []
+    for category in categories:
+        for key in preset_option_keys(presets, category):
+            flat_keys.append((category, key))
+        category_offsets.append(len(flat_keys))
+    key_ids = [intern(key) for _, key in flat_keys]
+    text_ids = [intern(presets[language].get(category, {}).get(key, "") or "")
+                for language in languages for category, key in flat_keys]
+
+    encoded = [text.encode("utf-8") for text in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+    pool = b"".join(encoded)
+
+    sections, pool_offset = _section_layout(len(languages), len(categories), len(flat_keys), len(strings))
+    arrays = {
+        "language_ids": language_ids,
+        "category_ids": category_ids,
+        "category_offsets": category_offsets,
+        "key_ids": key_ids,
+        "text_ids": text_ids,
+        "string_offsets": string_offsets
+    }
+    buffer = bytearray(pool_offset + len(pool))
+    for name, offset, count in sections:
+        data = np.asarray(arrays[name], dtype=_INDEX_DTYPE).tobytes()
+        buffer[offset:offset + len(data)] = data
+    buffer[pool_offset:] = pool
+
+    # 以表体内容的哈希作为版本号，内容不变则版本不变
+    body = bytes(buffer[_HEADER.size:])
+    version = int.from_bytes(hashlib.blake2b(body, digest_size=8).digest(), "little")
+    _HEADER.pack_into(buffer, 0, TABLE_MAGIC, LAYOUT_VERSION, version,
+                      len(languages), len(categories), len(flat_keys), len(strings), len(pool))
+    return bytes(buffer), version
+
+
+def _version_path(path, version):
+    """指针文件 path 对应的某个版本的表文件路径"""
+    return f"{os.path.splitext(path)[0]}.{version:016x}.bin"
+
+
+def _atomic_write(path, data):
+    """写临时文件后 os.replace，读者只会看到完整的旧文件或新文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".presets-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_table_pointer(path):
+    """读取指针文件，返回 (版本号, 表文件路径)；文件不存在或格式不对时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+        version = int(pointer["version"])
+        table_path = os.path.join(os.path.dirname(os.path.abspath(path)), pointer["file"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return version, table_path
+
+
+def read_table_version(path):
+    """读取指针文件中的当前版本号，不存在时返回 None"""
+    pointer = read_table_pointer(path)
+    return pointer[0] if pointer else None
+
+
+def prune_preset_tables(path, keep=2):
+    """删除较旧的表文件，保留指针指向的版本和最近的 keep 个版本；删除失败（仍被映射）时跳过"""
+    pointer = read_table_pointer(path)
+    current = pointer[1] if pointer else None
+    pattern = f"{glob.escape(os.path.splitext(path)[0])}.{'[0-9a-f]' * 16}.bin"
+    candidates = sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)
+    for table_path in candidates[keep:]:
+        if current and os.path.abspath(table_path) == os.path.abspath(current):
+            continue
+        try:
+            os.remove(table_path)
+        except OSError:
+            pass
+
+
+def publish_preset_table(presets, path, keep=2):
+    """
+    编译并发布预设表，返回版本号
+    path 为指针文件；表写入同目录下以版本号命名的新文件，再原子地替换指针
+    当前已是相同版本时不重写，已挂载的工作进程不会被判定为过期
+    """
+    payload, version = compile_preset_table(presets)
+    if read_table_version(path) == version:
+        return version
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    table_path = _version_path(path, version)
+    if not os.path.exists(table_path):
+        _atomic_write(table_path, payload)
+    pointer = {"version": version, "file": os.path.basename(table_path)}
+    _atomic_write(path, json.dumps(pointer).encode("utf-8"))
+    prune_preset_tables(path, keep)
+    return version
+
+
+class SharedPresetTable:
+    """
+    以 mmap 零拷贝挂载的只读预设表
+    下标数组是直接指向映射内存的 NumPy 视图，字符串在访问时才解码
+    path 为指针文件，挂载的是指针当时指向的版本
+    """
+
+    def __init__(self, path):
+        self.path = path
+        pointer = read_table_pointer(path)
+        if pointer is None:
+            raise FileNotFoundError(f"{path} is not a published preset table pointer")
+        self.table_path = pointer[1]
+        with open(self.table_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, layout_version, version, n_languages, n_categories, n_keys, n_strings, pool_size = \
+            _HEADER.unpack_from(self._mmap, 0)
+        if magic != TABLE_MAGIC or layout_version != LAYOUT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"{self.table_path} is not a preset table (layout version {LAYOUT_VERSION})")
+        self.version = version
+
+        sections, self._pool_offset = _section_layout(n_languages, n_categories, n_keys, n_strings)
+        for name, offset, count in sections:
+            setattr(self, name, np.frombuffer(self._mmap, dtype=_INDEX_DTYPE, count=count, offset=offset))
+
+        # 语言和分类名很少，挂载时解码一次
+        self.languages = [self.string(i) for i in self.language_ids]
+        self.categories = [self.string(i) for i in self.category_ids]
+        self._language_index = {language: i for i, language in enumerate(self.languages)}
+        self._category_index = {category: i for i, category in enumerate(self.categories)}
+
+    def string(self, string_id):
+        """按 id 从字符串池中解码字符串"""
+        start = self._pool_offset + int(self.string_offsets[string_id])
+        end = self._pool_offset + int(self.string_offsets[string_id + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def strings(self, string_ids):
+        """批量解码字符串：偏移量用 NumPy 一次取出，避免逐个做数组标量转换"""
+        ids = np.asarray(string_ids, dtype=np.int64)
+        starts = (self.string_offsets[ids] + self._pool_offset).tolist()
+        ends = (self.string_offsets[ids + 1] + self._pool_offset).tolist()
+        data = self._mmap
+        return [data[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+
+    def option_range(self, category):
+        """返回分类在选项数组中的区间 (start, end)"""
+        index = self._category_index[category]
+        return int(self.category_offsets[index]), int(self.category_offsets[index + 1])
+
+    def option_count(self, category):
+        start, end = self.option_range(category)
+        return end - start
+
+    def options(self, category):
+        """返回分类的选项键名列表，下标即键向量中的取值"""
+        start, end = self.option_range(category)
+        return self.strings(self.key_ids[start:end])
+
+    def text(self, language, category, index):
+        """返回某语言下分类第 index 个选项的显示文本"""
+        start, _ = self.option_range(category)
+        row = self._language_index[language] * len(self.key_ids)
+        return self.string(self.text_ids[row + start + index])
+
+    def texts(self, language, category):
+        """返回某语言下分类所有选项的显示文本，顺序与 options() 一致"""
+        start, end = self.option_range(category)
+        row = self._language_index[language] * len(self.key_ids)
+        return self.strings(self.text_ids[row + start:row + end])
+
+    def to_presets(self):
+        """还原为 {language: {category: {key: text}}} 形式的字典，只包含选项，不含 none/random 占位项"""
+        presets = {}
+        for language in self.languages:
+            presets[language] = {}
+            for category in self.categories:
+                presets[language][category] = dict(zip(self.options(category), self.texts(language, category)))
+        return presets
+
+    def is_stale(self):
+        """指针文件中的版本与已挂载的版本不同（预设已重新发布）"""
+        return read_table_version(self.path) != self.version
+
+    def refresh(self):
+        """如果已过期，关闭当前映射并挂载新表；返回当前有效的表"""
+        if not self.is_stale():
+            return self
+        self.close()
+        return SharedPresetTable(self.path)
+
+    def close(self):
+        """
+        释放 NumPy 视图后关闭映射
+        调用方仍持有从下标数组切出的视图时（如 keys = table.key_ids[0:3]）映射无法立即关闭，
+        此时只放弃本对象的引用，映射在最后一个视图被回收时自动释放，已有的视图仍然可读
+        """
+        if self._mmap is None:
+            return
+        for name in ["language_ids", "category_ids", "category_offsets", "key_ids", "text_ids", "string_offsets"]:
+            setattr(self, name, None)
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_preset_table(path):
+    """工作进程挂载已发布的预设表"""
+    return SharedPresetTable(path)
+
+
+class _OptionKeys:
+    """
+    某个分类的可随机选项：只保存选项位置数组，按下标访问时才解码键名（支持 len() 和 random.choice）
+    解码过的键名按下标缓存，长时间运行时很快退化为普通的字典查找
+    """
+
+    def __init__(self, view, category, positions):
+        self._view = view
+        self._category = category
+        self._positions = positions
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        key = self._keys.get(index)
+        if key is None:
+            key = self._keys[index] = self._view.key(self._category, int(self._positions[index]))
+        return key
+
+    def __iter__(self):
+        for position in self._positions:
+            yield self._view.key(self._category, int(position))
+
+    def __contains__(self, key):
+        return self._view.text(self._category, key) is not None
+
+
+class _OptionTexts:
+    """某个分类的 键名 -> 显示文本 查找，只在访问时解码，"none" 和空文本查不到"""
+
+    def __init__(self, view, category, cache):
+        self._view = view
+        self._category = category
+        self._cache = cache
+
+    def get(self, key, default=None):
+        # 随机抽取的键名在解码时已缓存了文本，直接命中
+        text = self._cache.get(key)
+        if text is None:
+            text = self._view.text(self._category, key)
+        return default if text is None else text
+
+    def __getitem__(self, key):
+        text = self._view.text(self._category, key)
+        if text is None:
+            raise KeyError(key)
+        return text
+
+    def __contains__(self, key):
+        return self._view.text(self._category, key) is not None
+
+
+class PresetTableView:
+    """
+    共享预设表在某种语言下的查找视图，接口与 compile_verified_table 中的 options / texts 相同：
+    options[category] 为可随机选择的键名序列，texts[category].get(key) 返回显示文本
+    挂载时只用 NumPy 在下标数组上计算每个分类的可选位置，键名和文本都在访问时才从字符串池解码，
+    只缓存访问过的选项；refresh() 发现新版本时原地重建，持有 options / texts 的流水线无需重建
+    """
+
+    def __init__(self, path, language, categories):
+        self.language = language
+        self.categories = list(categories)
+        self.options = {}
+        self.texts = {}
+        self.table = attach_preset_table(path)
+        self._load()
+
+    @property
+    def version(self):
+        return self.table.version
+
+    def _load(self):
+        table = self.table
+        if self.language not in table._language_index:
+            raise ValueError(f"Preset table {table.path} has no language '{self.language}'")
+        self._row = table._language_index[self.language] * len(table.key_ids)
+        self._ranges = {}
+        self._text_cache = {}
+        self._indexed = set()
+        self.options.clear()
+        self.texts.clear()
+        lengths = np.diff(table.string_offsets.astype(np.int64))
+        for category in self.categories:
+            if category in table._category_index:
+                start, end = table.option_range(category)
+            else:
+                start = end = 0
+            self._ranges[category] = (start, end)
+            cache = self._text_cache[category] = {}
+            # 显示文本非空的选项才可以被随机选中
+            text_ids = table.text_ids[self._row + start:self._row + end]
+            self.options[category] = _OptionKeys(self, category, np.flatnonzero(lengths[text_ids] > 0))
+            self.texts[category] = _OptionTexts(self, category, cache)
+
+    def key(self, category, position):
+        """解码分类中第 position 个选项的键名，同时解码并缓存它的显示文本（随后的 text() 查找直接命中缓存）"""
+        index = self._ranges[category][0] + position
+        table = self.table
+        key = table.string(table.key_ids[index])
+        text = table.string(table.text_ids[self._row + index])
+        self._text_cache[category][key] = text or None
+        return key
+
+    def text(self, category, key):
+        """返回键名的显示文本；未知键名、"none" 或空文本返回 None"""
+        cache = self._text_cache.get(category)
+        if cache is None:
+            return None
+        if key not in cache and category not in self._indexed:
+            # 固定选择的键名没有经过随机抽取，第一次查找未命中时为该分类批量解码全部键名和文本
+            start, end = self._ranges[category]
+            table = self.table
+            keys = table.strings(table.key_ids[start:end])
+            texts = table.strings(table.text_ids[self._row + start:self._row + end])
+            for option_key, option_text in zip(keys, texts):
+                cache.setdefault(option_key, option_text or None)
+            self._indexed.add(category)
+        return cache.get(key)
+
+    def refresh(self):
+        """预设表重新发布后重新挂载并原地重建查找，返回是否发生了重新加载"""
+        if not self.table.is_stale():
+            return False
+        self.table = self.table.refresh()
+        self._load()
+        return True
+
+    def close(self):
+        self.table.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish a preset JSON file as a shared preset table")
+    parser.add_argument("presets", help="preset JSON file, e.g. Prompt_Presets.json")
+    parser.add_argument("table", help="pointer file to publish, e.g. /tmp/video_presets.table")
+    parser.add_argument("--keep", type=int, default=2, help="number of table versions to keep")
+    args = parser.parse_args()
+
+    with open(args.presets, "r", encoding="utf-8") as f:
+        presets = json.load(f)
+    version = publish_preset_table(presets, args.table, args.keep)
+    print(f"Published {args.presets} as {args.table} (version {version:016x})")
+
+
+if __name__ == "__main__":
+    main()
+
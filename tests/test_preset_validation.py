@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+预设校验测试
+Tests for validate_presets
+"""
+
+import copy
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from image_nodes import IMAGE_CATEGORIES, IMAGE_PRESETS, IMAGE_UI_LABELS_DATA  # noqa: E402
+from nodes import UI_LABELS_DATA, VIDEO_CATEGORIES, VIDEO_PRESETS  # noqa: E402
+from preset_validation import validate_presets  # noqa: E402
+
+GENERATORS = {
+    "video": (VIDEO_PRESETS, UI_LABELS_DATA, VIDEO_CATEGORIES),
+    "image": (IMAGE_PRESETS, IMAGE_UI_LABELS_DATA, IMAGE_CATEGORIES)
+}
+
+
+def find(issues, code, **fields):
+    return [issue for issue in issues
+            if issue["code"] == code and all(issue[name] == value for name, value in fields.items())]
+
+
+def option(presets, language, category):
+    """返回分类中第一个可选项的键名"""
+    return next(key for key, text in presets[language][category].items() if key not in ("none", "random") and text)
+
+
+@pytest.mark.parametrize("generator", ["video", "image"])
+def test_shipped_presets_have_no_errors(generator):
+    presets, labels_data, categories = GENERATORS[generator]
+    assert [issue for issue in validate_presets(presets, labels_data, categories) if issue["severity"] == "error"] == []
+
+
+def test_missing_key_is_an_error():
+    presets = copy.deepcopy(VIDEO_PRESETS)
+    key = option(presets, "zh", "lens")
+    del presets["zh"]["lens"][key]
+    issues = find(validate_presets(presets, UI_LABELS_DATA, VIDEO_CATEGORIES), "missing_key",
+                  language="zh", category="lens", key=key)
+    assert len(issues) == 1
+    assert issues[0]["severity"] == "error"
+
+
+def test_duplicate_text_is_a_warning():
+    presets = copy.deepcopy(VIDEO_PRESETS)
+    first, second = [key for key in presets["en"]["lens"] if key not in ("none", "random")][:2]
+    presets["en"]["lens"][second] = presets["en"]["lens"][first]
+    issues = find(validate_presets(presets, UI_LABELS_DATA, VIDEO_CATEGORIES), "duplicate_text",
+                  language="en", category="lens")
+    assert len(issues) == 1
+    assert issues[0]["severity"] == "warning"
+    assert issues[0]["key"] == second
+
+
+def test_random_sentinel_is_reported():
+    presets = copy.deepcopy(VIDEO_PRESETS)
+    presets["en"]["lens"]["random"] = "random"
+    issues = find(validate_presets(presets, UI_LABELS_DATA, VIDEO_CATEGORIES), "random_sentinel",
+                  language="en", category="lens")
+    assert len(issues) == 1
+    assert issues[0]["severity"] == "info"
+    # 占位值不是可选项，不应同时被当作缺失或重复的选项报告
+    assert find(validate_presets(presets, UI_LABELS_DATA, VIDEO_CATEGORIES), "missing_key", key="random") == []
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式批量生成的续跑、截断和分片测试
+Resume, truncation and shard tests for prompt_stream
+"""
+
+import copy
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from prompt_stream import CallbackSink, FileSink, run_prompt_stream  # noqa: E402
+
+CONFIG = {"generator": "video", "count": 50, "seed": 42, "language": "en"}
+
+
+class Crash(Exception):
+    pass
+
+
+def crash_after(chunks, chunk_size):
+    """在写完第 chunks 个分块（检查点已记录）后模拟崩溃"""
+    def progress(done, total):
+        if done >= chunks * chunk_size:
+            raise Crash()
+    return progress
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("output_format", ["text", "jsonl"])
+def test_resume_after_crash_is_byte_identical(tmp_path, output_format):
+    expected = tmp_path / "expected.out"
+    run_prompt_stream(FileSink(str(expected), output_format), chunk_size=7, **CONFIG)
+
+    output = tmp_path / "resumed.out"
+    checkpoint = str(tmp_path / "job.ckpt.json")
+    with pytest.raises(Crash):
+        run_prompt_stream(FileSink(str(output), output_format), chunk_size=7, checkpoint_path=checkpoint,
+                          progress=crash_after(3, 7), **CONFIG)
+    # 模拟崩溃前写了一半、尚未记录检查点的输出，续跑时应被截断
+    with open(output, "ab") as f:
+        f.write(b"half-written line")
+    written = run_prompt_stream(FileSink(str(output), output_format), chunk_size=7, checkpoint_path=checkpoint,
+                                resume=True, **CONFIG)
+
+    assert written == CONFIG["count"] - 3 * 7
+    assert read_bytes(output) == read_bytes(expected)
+
+
+def test_resume_rejects_output_shorter_than_checkpoint(tmp_path):
+    output = tmp_path / "prompts.txt"
+    checkpoint = str(tmp_path / "job.ckpt.json")
+    with pytest.raises(Crash):
+        run_prompt_stream(FileSink(str(output)), chunk_size=5, checkpoint_path=checkpoint,
+                          progress=crash_after(2, 5), **CONFIG)
+
+    with open(output, "r+b") as f:
+        f.truncate(10)
+    with pytest.raises(ValueError):
+        run_prompt_stream(FileSink(str(output)), chunk_size=5, checkpoint_path=checkpoint, resume=True, **CONFIG)
+
+    os.remove(output)
+    with pytest.raises(ValueError):
+        run_prompt_stream(FileSink(str(output)), chunk_size=5, checkpoint_path=checkpoint, resume=True, **CONFIG)
+
+
+def test_shards_concatenate_to_single_run(tmp_path):
+    single = tmp_path / "single.jsonl"
+    run_prompt_stream(FileSink(str(single), "jsonl"), chunk_size=8, **CONFIG)
+
+    parts = []
+    for shard in range(3):
+        part = tmp_path / f"part{shard}.jsonl"
+        run_prompt_stream(FileSink(str(part), "jsonl"), chunk_size=8, shard=shard, shards=3, **CONFIG)
+        parts.append(read_bytes(part))
+
+    assert b"".join(parts) == read_bytes(single)
+
+
+def test_key_vectors_survive_resume_and_shards(tmp_path):
+    expected = tmp_path / "expected.npy"
+    run_prompt_stream(CallbackSink(lambda chunk: None), chunk_size=6, keys_output=str(expected), **CONFIG)
+
+    keys = tmp_path / "resumed.npy"
+    checkpoint = str(tmp_path / "job.ckpt.json")
+    with pytest.raises(Crash):
+        run_prompt_stream(CallbackSink(lambda chunk: None), chunk_size=6, checkpoint_path=checkpoint,
+                          progress=crash_after(2, 6), keys_output=str(keys), **CONFIG)
+    run_prompt_stream(CallbackSink(lambda chunk: None), chunk_size=6, checkpoint_path=checkpoint, resume=True,
+                      keys_output=str(keys), **CONFIG)
+    assert np.array_equal(np.load(keys), np.load(expected))
+
+    parts = []
+    for shard in range(3):
+        part = tmp_path / f"part{shard}.npy"
+        run_prompt_stream(CallbackSink(lambda chunk: None), chunk_size=6, shard=shard, shards=3,
+                          keys_output=str(part), **CONFIG)
+        parts.append(np.load(part))
+    assert np.array_equal(np.concatenate(parts), np.load(expected))
+
+
+def test_shared_preset_table_matches_json_and_picks_up_republish(tmp_path):
+    from nodes import VIDEO_PRESETS
+    from shared_presets import publish_preset_table
+
+    pointer = str(tmp_path / "video.table")
+    publish_preset_table(VIDEO_PRESETS, pointer)
+    expected, shared = [], []
+    run_prompt_stream(CallbackSink(expected.extend), chunk_size=7, **CONFIG)
+    run_prompt_stream(CallbackSink(shared.extend), chunk_size=7, preset_table=pointer, **CONFIG)
+    assert shared == expected
+
+    presets = copy.deepcopy(VIDEO_PRESETS)
+    received = []
+
+    def republish_after_first_chunk(chunk):
+        received.extend(chunk)
+        if len(received) == 10:
+            presets["en"]["lens"]["wide_angle"] = "republished lens"
+            publish_preset_table(presets, pointer)
+
+    run_prompt_stream(CallbackSink(republish_after_first_chunk), chunk_size=10, preset_table=pointer,
+                      selections={"lens": "wide_angle"}, **CONFIG)
+    assert not any("republished lens" in prompt for _, prompt, _, _ in received[:10])
+    assert all("republished lens" in prompt for _, prompt, _, _ in received[10:])
+
+
+def test_sampled_key_vectors_match_stream_keys_output(tmp_path):
+    from batch_analytics import sample_key_vectors
+
+    keys = tmp_path / "keys.npy"
+    run_prompt_stream(CallbackSink(lambda chunk: None), chunk_size=6, keys_output=str(keys), **CONFIG)
+    sampled = sample_key_vectors(CONFIG["generator"], CONFIG["count"], CONFIG["seed"], CONFIG["language"],
+                                 chunk_size=16)
+    assert sampled.dtype == np.int32
+    assert np.array_equal(sampled, np.load(keys))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Token 预算装箱测试（使用字符启发式计数）
+Token budget packing tests, using the heuristic counter
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import prompt_tokens  # noqa: E402
+from prompt_stream import GENERATORS, sample_selections  # noqa: E402
+from prompt_tokens import count_tokens, fit_elements_to_budget  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def heuristic_counter():
+    """无论是否设置了 PROMPT_HELPER_TOKENIZER，都用启发式计数，测试结束后恢复"""
+    previous = prompt_tokens._tokenizer
+    prompt_tokens.set_tokenizer(None)
+    yield
+    prompt_tokens.set_tokenizer(previous)
+
+
+def test_fit_elements_returns_reserved_cost_and_skips_what_does_not_fit():
+    items = [("a", "one two three"), ("b", "four five six seven eight"), ("c", "nine")]
+    kept, reserved = fit_elements_to_budget(items, 10, ["user prompt here"], ", ")
+    assert reserved == 3
+    # 3 + (3 + 1) 之后剩 3，第二个元素放不下，继续装入后面更短的元素
+    assert kept == [("a", "one two three"), ("c", "nine")]
+
+    assert fit_elements_to_budget(items, 0, ["user prompt here"]) == (items, 0)
+    assert fit_elements_to_budget(items, 2, ["user prompt here"]) == ([], 3)
+
+
+@pytest.mark.parametrize("generator", ["video", "image"])
+@pytest.mark.parametrize("language", ["zh", "en"])
+@pytest.mark.parametrize("prompt_format", ["simple", "professional", "detailed"])
+def test_generated_prompt_stays_within_budget(generator, language, prompt_format):
+    node_class, table, categories = GENERATORS[generator]
+    node = node_class()
+    user_prompt = table[language]["labels"]["default_prompt"]
+    options = table[language]["options"]
+    for max_tokens in (15, 30, 45, 75):
+        for _, _, category_params in sample_selections(categories, options, {}, max_tokens, 0, 30):
+            generated_prompt, selected_elements, reserved_tokens = node.format_prompt(
+                user_prompt, category_params, prompt_format, max_tokens, language)
+            if reserved_tokens > max_tokens:
+                assert selected_elements == []
+            else:
+                assert count_tokens(generated_prompt) <= max_tokens, generated_prompt